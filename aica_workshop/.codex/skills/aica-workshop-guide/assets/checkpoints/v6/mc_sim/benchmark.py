@@ -0,0 +1,338 @@
+"""Repeatable timing measurements for the Monte Carlo π simulation.
+
+Every benchmark case separates the two phases of a run: *spawn* (starting and
+warming a worker pool) and *compute* (one estimate on an already warm pool).
+Compute is measured after `warmup` untimed runs and repeated `repeats` times,
+and each phase is reported as a mean with a 95% confidence interval.
+
+Results are written as JSON stamped with the environment they were measured
+in, so a later run can be checked against a saved baseline with
+`compare_results`.
+"""
+
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+
+import numpy as np
+
+from .resources import detect_cpus
+from .simulate import MonteCarloSession
+
+BENCHMARK_FORMAT = "mc_sim.benchmark/1"
+
+SCALING_KINDS = ("strong", "weak")
+
+# Two-sided 95% critical values of Student's t by degrees of freedom; the
+# largest tabulated df not above the actual df is used, which errs wide.
+_T_CRITICAL_95 = {
+    1: 12.706,
+    2: 4.303,
+    3: 3.182,
+    4: 2.776,
+    5: 2.571,
+    6: 2.447,
+    7: 2.365,
+    8: 2.306,
+    9: 2.262,
+    10: 2.228,
+    15: 2.131,
+    20: 2.086,
+    30: 2.042,
+    60: 2.000,
+    120: 1.980,
+}
+
+
+def _t_critical(df: int) -> float:
+    return _T_CRITICAL_95[max(key for key in _T_CRITICAL_95 if key <= df)]
+
+
+@dataclass(frozen=True)
+class Summary:
+    """Mean of repeated measurements with a 95% confidence interval."""
+
+    mean: float
+    stdev: float
+    ci_low: float
+    ci_high: float
+    n: int
+
+    @property
+    def half_width(self) -> float:
+        return (self.ci_high - self.ci_low) / 2
+
+
+def summarize(values: Sequence[float]) -> Summary:
+    """Return the mean and t-based 95% confidence interval of `values`."""
+
+    if not values:
+        raise ValueError("values must not be empty")
+    mean = statistics.mean(values)
+    if len(values) == 1:
+        return Summary(mean, 0.0, mean, mean, 1)
+    stdev = statistics.stdev(values)
+    half_width = _t_critical(len(values) - 1) * stdev / math.sqrt(len(values))
+    return Summary(mean, stdev, mean - half_width, mean + half_width, len(values))
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    """Timings for one configuration.
+
+    `efficiency` is only set for scaling cases: T1 / (p * Tp) for strong
+    scaling and T1 / Tp for weak scaling, from mean compute times relative to
+    the smallest worker count measured.
+    """
+
+    name: str
+    kind: str
+    backend: str
+    workers: int
+    n_samples: int
+    options: Dict[str, Any]
+    spawn: Summary
+    compute: Summary
+    samples_per_second: Summary
+    efficiency: Optional[float] = None
+
+
+def measure_spawn(num_workers: int, backend: str, repeats: int) -> Summary:
+    """Time starting and warming a fresh pool `repeats` times."""
+
+    timings = []
+    for _ in range(repeats):
+        session = MonteCarloSession(num_workers, backend=backend)
+        try:
+            timings.append(session.start())
+        finally:
+            session.close()
+    return summarize(timings)
+
+
+def measure_compute(
+    session: MonteCarloSession,
+    n_samples: int,
+    *,
+    warmup: int,
+    repeats: int,
+    **options: Any,
+) -> List[float]:
+    """Return the compute time of `repeats` estimates after `warmup` untimed ones.
+
+    Times come from `PiEstimate.elapsed_seconds`, so they exclude pool startup.
+    """
+
+    for _ in range(warmup):
+        session.simulate_pi(n_samples, **options)
+    return [
+        session.simulate_pi(n_samples, **options).elapsed_seconds
+        for _ in range(repeats)
+    ]
+
+
+def run_case(
+    name: str,
+    kind: str,
+    *,
+    num_workers: int,
+    backend: str,
+    n_samples: int,
+    warmup: int,
+    repeats: int,
+    spawn_repeats: int,
+    **options: Any,
+) -> BenchmarkCase:
+    """Measure the spawn and compute phases of one configuration."""
+
+    spawn = measure_spawn(num_workers, backend, spawn_repeats)
+    with MonteCarloSession(num_workers, backend=backend) as session:
+        timings = measure_compute(
+            session, n_samples, warmup=warmup, repeats=repeats, **options
+        )
+    return BenchmarkCase(
+        name=name,
+        kind=kind,
+        backend=backend,
+        workers=num_workers,
+        n_samples=n_samples,
+        options=options,
+        spawn=spawn,
+        compute=summarize(timings),
+        samples_per_second=summarize([n_samples / seconds for seconds in timings]),
+    )
+
+
+def scaling_worker_counts(max_workers: int) -> List[int]:
+    """Return 1, 2, 4, ... up to and including `max_workers`."""
+
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if max_workers > 1:
+        counts.append(max_workers)
+    return counts
+
+
+def run_scaling(
+    kind: str,
+    backend: str,
+    worker_counts: Iterable[int],
+    n_samples: int,
+    *,
+    warmup: int,
+    repeats: int,
+    spawn_repeats: int,
+    **options: Any,
+) -> List[BenchmarkCase]:
+    """Measure strong or weak scaling over `worker_counts`.
+
+    Strong scaling keeps `n_samples` fixed; weak scaling gives every worker
+    `n_samples` samples, so ideal runtime stays constant.
+    """
+
+    if kind not in SCALING_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(SCALING_KINDS)}")
+    cases = []
+    for num_workers in worker_counts:
+        total = n_samples if kind == "strong" else n_samples * num_workers
+        case = run_case(
+            f"{kind}/{backend}/w{num_workers}/n{total}",
+            kind,
+            num_workers=num_workers,
+            backend=backend,
+            n_samples=total,
+            warmup=warmup,
+            repeats=repeats,
+            spawn_repeats=spawn_repeats,
+            **options,
+        )
+        reference = cases[0] if cases else case
+        ideal = reference.compute.mean
+        if kind == "strong":
+            ideal *= reference.workers / num_workers
+        cases.append(replace(case, efficiency=ideal / case.compute.mean))
+    return cases
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def _cpu_model() -> str:
+    try:
+        for line in Path("/proc/cpuinfo").read_text(encoding="utf-8").splitlines():
+            if line.startswith("model name"):
+                return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def environment_metadata() -> Dict[str, Any]:
+    """Describe the machine and software a benchmark ran on."""
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "hostname": socket.gethostname(),
+        "platform": platform.platform(),
+        "cpu_model": _cpu_model(),
+        "cpus": asdict(detect_cpus()),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "git_commit": _git_commit(),
+        "slurm_job_id": os.getenv("SLURM_JOB_ID"),
+    }
+
+
+def write_results(
+    path: Path, cases: Iterable[BenchmarkCase], config: Dict[str, Any]
+) -> None:
+    """Write benchmark cases, their configuration and environment as JSON."""
+
+    record = {
+        "format": BENCHMARK_FORMAT,
+        "environment": environment_metadata(),
+        "config": config,
+        "cases": [asdict(case) for case in cases],
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(record, indent=2) + "\n", encoding="utf-8")
+
+
+def read_results(path: Path) -> Dict[str, Any]:
+    """Load a results file written by `write_results`."""
+
+    record = json.loads(Path(path).read_text(encoding="utf-8"))
+    if record.get("format") != BENCHMARK_FORMAT:
+        raise ValueError(f"{path} is not a {BENCHMARK_FORMAT} results file")
+    return record
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """Throughput of one case in a baseline and a current run.
+
+    `change` is the relative change in mean samples/s. A case regresses when it
+    slowed down by more than `threshold`, which is the requested noise
+    threshold widened to the two runs' combined confidence intervals.
+    """
+
+    name: str
+    baseline: float
+    current: float
+    change: float
+    threshold: float
+    regressed: bool
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any], noise_threshold: float = 0.05
+) -> List[Comparison]:
+    """Compare samples/s of the cases present in both result sets."""
+
+    baseline_cases = {case["name"]: case for case in baseline["cases"]}
+    comparisons = []
+    for case in current["cases"]:
+        before = baseline_cases.get(case["name"])
+        if before is None:
+            continue
+        old = before["samples_per_second"]
+        new = case["samples_per_second"]
+        noise = (
+            (old["ci_high"] - old["ci_low"]) + (new["ci_high"] - new["ci_low"])
+        ) / 2 / old["mean"]
+        threshold = max(noise_threshold, noise)
+        change = new["mean"] / old["mean"] - 1
+        comparisons.append(
+            Comparison(
+                name=case["name"],
+                baseline=old["mean"],
+                current=new["mean"],
+                change=change,
+                threshold=threshold,
+                regressed=change < -threshold,
+            )
+        )
+    return comparisons
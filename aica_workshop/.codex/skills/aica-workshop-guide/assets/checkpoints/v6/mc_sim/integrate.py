@@ -0,0 +1,343 @@
+"""Monte Carlo integration of vectorized integrands over boxes in d dimensions.
+
+`integrate` runs on the same engine as `simulate_pi`: samples are split into
+logical RNG blocks, blocks are handed to a `MonteCarloSession` pool as tasks,
+and block `i` always draws from the `i`-th child of the run's SeedSequence, so
+a seeded integral does not depend on the worker count, backend or schedule.
+Each task evaluates the integrand batch by batch on one reused points buffer
+and returns only the sum and sum of squares of the values it saw.
+
+The π counter keeps its own kernel (samplers, float32/uint32 points and exact
+integer counts), but for float64 random points it draws the same numbers, so
+`4 * integrate(hypersphere_indicator, 2, n, seed=s).value` reproduces
+`estimate_pi(n, seed=s)`.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import math
+import time
+import tracemalloc
+
+import numpy as np
+
+from .resources import available_workers
+from .simulate import (
+    BLOCK_SIZE,
+    SCHEDULES,
+    BlockRange,
+    MonteCarloSession,
+    PointArray,
+    _block_count,
+    _block_rng,
+    _block_samples,
+)
+from .tracing import Recorder, Tracer
+
+# A vectorized integrand maps an (n, d) float64 array of points to n values.
+# With the "processes" backend it must be picklable (a module-level function).
+Integrand = Callable[[PointArray], PointArray]
+
+# One (low, high) pair per dimension.
+Domain = Sequence[Tuple[float, float]]
+
+# Memory each worker may spend on one batch: the points buffer plus whatever
+# the integrand allocates per point. Memory per sample grows with the
+# dimension, so the autotuned batch shrinks as d grows.
+BATCH_MEMORY_BUDGET = 16 * 1024 * 1024
+
+# Batch sizes tried by `autotune_batch_size` are powers of two from here up to
+# the memory cap (and never above BLOCK_SIZE).
+MIN_BATCH_SIZE = 1024
+
+# Points evaluated per candidate batch size while autotuning, and per probe of
+# the integrand's memory use.
+AUTOTUNE_SAMPLES = 2 * BLOCK_SIZE
+MEMORY_PROBE_SAMPLES = 4096
+
+# Autotuned batch sizes by (integrand, dimension), so repeated calls in one
+# process pay for tuning once.
+_BATCH_SIZES: Dict[Tuple[Integrand, int], int] = {}
+
+
+def hypersphere_indicator(points: PointArray) -> PointArray:
+    """Return 1 for points inside the unit ball and 0 elsewhere."""
+
+    return np.einsum("ij,ij->i", points, points) <= 1.0
+
+
+def unit_ball_volume(dimension: int) -> float:
+    """Return the exact volume of the unit ball in `dimension` dimensions."""
+
+    return math.pi ** (dimension / 2) / math.gamma(dimension / 2 + 1)
+
+
+@dataclass(frozen=True)
+class IntegralEstimate:
+    """Outcome of one Monte Carlo integral.
+
+    `value` is the domain volume times the mean integrand value and
+    `std_error` its i.i.d. standard error. `worker_samples` and `entropy` have
+    the same meaning as on `PiEstimate`.
+    """
+
+    value: float
+    std_error: float
+    n_samples: int
+    elapsed_seconds: float
+    dimension: int
+    batch_size: int
+    n_tasks: int = 0
+    worker_samples: Dict[str, int] = field(default_factory=dict)
+    entropy: Optional[int] = None
+
+
+def _check_domain(
+    domain: Optional[Domain], dimension: int
+) -> Tuple[PointArray, PointArray]:
+    """Return the lower corner and edge lengths of `domain` (default [0, 1]^d)."""
+
+    if domain is None:
+        return np.zeros(dimension), np.ones(dimension)
+    bounds = np.asarray(domain, dtype=np.float64)
+    if bounds.shape != (dimension, 2):
+        raise ValueError(
+            f"domain must give one (low, high) pair for each of {dimension} dimensions"
+        )
+    widths = bounds[:, 1] - bounds[:, 0]
+    if not np.all(np.isfinite(bounds)) or np.any(widths <= 0):
+        raise ValueError("domain bounds must be finite with low < high")
+    return bounds[:, 0].copy(), widths
+
+
+def _evaluate(integrand: Integrand, points: PointArray) -> PointArray:
+    """Evaluate `integrand` and check it returned one value per point."""
+
+    values = np.asarray(integrand(points), dtype=np.float64)
+    if values.shape != (len(points),):
+        raise ValueError(
+            f"integrand must return shape ({len(points)},) for {len(points)} points, "
+            f"got {values.shape}"
+        )
+    return values
+
+
+def _integrate_chunk(
+    block_range: BlockRange,
+    *,
+    n_samples: int,
+    entropy: Any,
+    integrand: Integrand,
+    lows: PointArray,
+    widths: PointArray,
+    batch_size: int,
+    recorder: Optional[Recorder] = None,
+) -> PointArray:
+    """Return `[sum, sum of squares]` of the integrand over one chunk of blocks."""
+
+    first_block, stop_block = block_range
+    start = time.perf_counter()
+    buffer = np.empty((min(batch_size, BLOCK_SIZE, n_samples), len(lows)))
+    if recorder is not None:
+        recorder.add("scratch", start, time.perf_counter(), size=len(buffer))
+
+    totals = np.zeros(2)
+    for block_index in range(first_block, stop_block):
+        start = time.perf_counter() if recorder is not None else 0.0
+        rng = _block_rng(entropy, block_index)
+        block_samples = _block_samples(block_index, n_samples)
+        if recorder is not None:
+            recorder.add("seed", start, time.perf_counter(), block=block_index)
+        done = 0
+        while done < block_samples:
+            size = min(block_samples - done, len(buffer))
+            points = buffer[:size]
+            start = time.perf_counter() if recorder is not None else 0.0
+            rng.random(out=points)
+            points *= widths
+            points += lows
+            filled = time.perf_counter() if recorder is not None else 0.0
+            values = _evaluate(integrand, points)
+            totals[0] += values.sum()
+            totals[1] += np.dot(values, values)
+            if recorder is not None:
+                recorder.add("fill", start, filled, samples=size)
+                recorder.add("reduce", filled, time.perf_counter(), samples=size)
+            done += size
+    return totals
+
+
+def _bytes_per_sample(integrand: Integrand, dimension: int) -> float:
+    """Return the peak memory per point: coordinates plus integrand temporaries."""
+
+    points = np.random.default_rng(0).random((MEMORY_PROBE_SAMPLES, dimension))
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        _evaluate(integrand, points)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return points.itemsize * dimension + max(peak - baseline, 0) / MEMORY_PROBE_SAMPLES
+
+
+def autotune_batch_size(
+    integrand: Integrand,
+    dimension: int,
+    *,
+    memory_budget: int = BATCH_MEMORY_BUDGET,
+) -> int:
+    """Pick the batch size with the best throughput that fits `memory_budget`.
+
+    The integrand's memory per point is probed with `tracemalloc`, which caps
+    the batch size; the power-of-two candidates below the cap are then timed
+    on `AUTOTUNE_SAMPLES` points each. If the cap is below `MIN_BATCH_SIZE`,
+    the cap itself is returned untimed, so the budget is always respected.
+    Results are cached per integrand and dimension.
+    """
+
+    key = (integrand, dimension)
+    if key in _BATCH_SIZES:
+        return _BATCH_SIZES[key]
+
+    cap = int(memory_budget // _bytes_per_sample(integrand, dimension))
+    if cap < 1:
+        raise ValueError(
+            f"memory_budget of {memory_budget} bytes cannot hold one point of this "
+            f"integrand in {dimension} dimensions"
+        )
+    if cap < MIN_BATCH_SIZE:
+        _BATCH_SIZES[key] = cap
+        return cap
+    candidates = [MIN_BATCH_SIZE]
+    while candidates[-1] * 2 <= min(cap, BLOCK_SIZE):
+        candidates.append(candidates[-1] * 2)
+
+    rng = np.random.default_rng(0)
+    best_size, best_rate = candidates[0], 0.0
+    for size in candidates:
+        points = np.empty((size, dimension))
+        start = time.perf_counter()
+        for _ in range(max(1, AUTOTUNE_SAMPLES // size)):
+            rng.random(out=points)
+            _evaluate(integrand, points).sum()
+        rate = max(1, AUTOTUNE_SAMPLES // size) * size / (time.perf_counter() - start)
+        if rate > best_rate:
+            best_size, best_rate = size, rate
+    _BATCH_SIZES[key] = best_size
+    return best_size
+
+
+def integrate(
+    integrand: Integrand,
+    dimension: int,
+    n_samples: int,
+    *,
+    domain: Optional[Domain] = None,
+    num_workers: Optional[int] = None,
+    backend: str = "processes",
+    seed: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    schedule: str = "static",
+    task_blocks: Optional[int] = None,
+    session: Optional[MonteCarloSession] = None,
+    tracer: Optional[Tracer] = None,
+) -> IntegralEstimate:
+    """Estimate the integral of `integrand` over `domain` (default [0, 1]^d).
+
+    `integrand` receives float64 points of shape `(batch, dimension)` already
+    scaled to the domain and must return `batch` values (booleans are fine).
+    Without `batch_size` one is chosen by `autotune_batch_size`; it only
+    changes how many points are evaluated at once, not which points are drawn.
+    `num_workers`, `backend`, `seed`, `schedule`, `task_blocks`, `session` and
+    `tracer` work as for `simulate_pi`.
+    """
+
+    if dimension <= 0:
+        raise ValueError("dimension must be a positive integer")
+    if n_samples <= 0:
+        raise ValueError("n_samples must be a positive integer")
+    if batch_size is not None and batch_size <= 0:
+        raise ValueError("batch_size must be a positive integer")
+    if schedule not in SCHEDULES:
+        raise ValueError(f"schedule must be one of {', '.join(SCHEDULES)}")
+    if task_blocks is not None and task_blocks <= 0:
+        raise ValueError("task_blocks must be a positive integer")
+    if num_workers is None:
+        num_workers = available_workers() if session is None else session.num_workers
+    if num_workers <= 0:
+        raise ValueError("num_workers must be a positive integer")
+    lows, widths = _check_domain(domain, dimension)
+    if batch_size is None:
+        batch_size = autotune_batch_size(integrand, dimension)
+
+    entropy = np.random.SeedSequence(seed).entropy
+    blocks = (0, _block_count(n_samples))
+
+    def run(active: MonteCarloSession) -> Tuple[Any, float]:
+        active_tracer = tracer if tracer is not None else active.tracer
+        start = time.perf_counter()
+        tally = active._count_fixed(
+            n_samples,
+            entropy=entropy,
+            blocks=blocks,
+            schedule=schedule,
+            task_blocks=task_blocks,
+            tracer=active_tracer,
+            kernel=_integrate_chunk,
+            integrand=integrand,
+            lows=lows,
+            widths=widths,
+            batch_size=batch_size,
+        )
+        end = time.perf_counter()
+        if active_tracer is not None:
+            active_tracer.add("run", start, end, samples=tally.consumed)
+        return tally, end - start
+
+    if session is None:
+        with MonteCarloSession(
+            min(num_workers, blocks[1]), backend=backend, tracer=tracer
+        ) as temporary:
+            tally, elapsed = run(temporary)
+    else:
+        tally, elapsed = run(session)
+
+    total, total_squares = tally.total
+    mean = total / tally.consumed
+    variance = max(total_squares / tally.consumed - mean * mean, 0.0)
+    volume = float(np.prod(widths))
+    return IntegralEstimate(
+        value=volume * mean,
+        std_error=volume * math.sqrt(variance / tally.consumed),
+        n_samples=tally.consumed,
+        elapsed_seconds=elapsed,
+        dimension=dimension,
+        batch_size=batch_size,
+        n_tasks=tally.n_tasks,
+        worker_samples=tally.worker_samples,
+        entropy=entropy,
+    )
+
+
+def estimate_ball_volume(
+    dimension: int, n_samples: int, **kwargs: Any
+) -> IntegralEstimate:
+    """Estimate the volume of the unit ball in `dimension` dimensions.
+
+    Samples the cube [-1, 1]^d; accepts the keyword arguments of `integrate`.
+    Compare with `unit_ball_volume` for the exact value.
+    """
+
+    return integrate(
+        hypersphere_indicator,
+        dimension,
+        n_samples,
+        domain=[(-1.0, 1.0)] * dimension,
+        **kwargs,
+    )
@@ -0,0 +1,165 @@
+"""Save shard results as partial files and merge them into one estimate.
+
+A sharded run splits one simulation across independent jobs (a Slurm job array,
+several `srun` steps, or local subprocesses). Each shard writes its raw counts,
+run metadata and the range of logical RNG blocks it drew as JSON;
+`merge_partials` sums any number of those files into a single estimate with a
+combined standard error.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import json
+import os
+import socket
+
+from .simulate import PiEstimate, _std_error
+
+PARTIAL_FORMAT = "mc_sim.partial/1"
+
+# Metadata that changes how samples are computed but not which samples are
+# drawn, so shards that differ only in these still belong to the same run.
+EXECUTION_KEYS = ("chunk_size", "use_vectorized")
+
+
+def write_partial(path: Path, result: PiEstimate, metadata: Dict[str, Any]) -> None:
+    """Atomically write one shard's raw counts and metadata to `path`.
+
+    `metadata` holds the run settings (sample budget, sampler, seed, ...) needed
+    to tell which shards belong together when they are merged.
+    """
+
+    shard_index, shard_count = result.shard if result.shard is not None else (0, 1)
+    record = {
+        "format": PARTIAL_FORMAT,
+        "shard": shard_index,
+        "num_shards": shard_count,
+        "inside": result.inside,
+        "n_samples": result.n_samples,
+        "elapsed_seconds": result.elapsed_seconds,
+        "entropy": result.entropy,
+        "blocks": list(result.blocks) if result.blocks is not None else None,
+        "worker_samples": result.worker_samples,
+        "hostname": socket.gethostname(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "metadata": metadata,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(record, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def read_partial(path: Path) -> Dict[str, Any]:
+    """Load a partial file written by `write_partial`."""
+
+    try:
+        record = json.loads(Path(path).read_text(encoding="utf-8"))
+    except ValueError as exc:
+        raise ValueError(f"{path} is not valid JSON: {exc}") from exc
+    if not isinstance(record, dict) or record.get("format") != PARTIAL_FORMAT:
+        raise ValueError(f"{path} is not a {PARTIAL_FORMAT} partial file")
+    return record
+
+
+@dataclass(frozen=True)
+class MergedEstimate:
+    """Estimate reduced from several partial files.
+
+    `missing_shards` lists, for each run found among the partials, the shard
+    indices that were not supplied; the estimate is still valid without them,
+    just based on fewer samples.
+    """
+
+    estimate: float
+    inside: int
+    n_samples: int
+    std_error: float
+    n_partials: int
+    compute_seconds: float
+    missing_shards: Dict[str, List[int]]
+
+
+def _run_key(record: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Identify the run a partial belongs to."""
+
+    metadata = {
+        key: value
+        for key, value in record["metadata"].items()
+        if key not in EXECUTION_KEYS
+    }
+    return (
+        record["entropy"],
+        record["num_shards"],
+        json.dumps(metadata, sort_keys=True),
+    )
+
+
+def _check_block_overlap(records: List[Tuple[Path, Dict[str, Any]]]) -> None:
+    """Reject partials with the same entropy whose block ranges overlap."""
+
+    ranges_by_entropy: Dict[Any, List[Tuple[int, int, Path]]] = {}
+    for path, record in records:
+        if record.get("blocks") is not None:
+            first, stop = record["blocks"]
+            ranges_by_entropy.setdefault(record["entropy"], []).append(
+                (first, stop, path)
+            )
+    for ranges in ranges_by_entropy.values():
+        ranges.sort(key=lambda item: item[:2])
+        for (_, stop, path), (first, _, next_path) in zip(ranges, ranges[1:]):
+            if first < stop:
+                raise ValueError(
+                    f"{next_path} overlaps the blocks of {path} with the same "
+                    f"entropy, so their samples would be counted twice"
+                )
+
+
+def merge_partials(paths: Iterable[Path]) -> MergedEstimate:
+    """Sum the raw counts of any number of partial files into one estimate.
+
+    Partials from different runs may be merged (every sample is an unbiased
+    draw), but the same samples must not be counted twice: the same shard of
+    the same run is rejected, and so are partials with the same entropy whose
+    block ranges overlap, even if their settings differ.
+    """
+
+    records = [(Path(path), read_partial(path)) for path in paths]
+    if not records:
+        raise ValueError("no partial files to merge")
+
+    seen: Dict[Tuple[Any, ...], Path] = {}
+    shards_by_run: Dict[Tuple[Any, ...], set] = {}
+    for path, record in records:
+        run_key = _run_key(record)
+        shard_key = run_key + (record["shard"],)
+        if shard_key in seen:
+            raise ValueError(
+                f"{path} repeats shard {record['shard']} already read from "
+                f"{seen[shard_key]}"
+            )
+        seen[shard_key] = path
+        shards_by_run.setdefault(run_key, set()).add(record["shard"])
+    _check_block_overlap(records)
+
+    missing_shards = {}
+    for run_key, shards in shards_by_run.items():
+        missing = sorted(set(range(run_key[1])) - shards)
+        if missing:
+            missing_shards[f"entropy={run_key[0]}"] = missing
+
+    inside = sum(record["inside"] for _, record in records)
+    n_samples = sum(record["n_samples"] for _, record in records)
+    return MergedEstimate(
+        estimate=4 * inside / n_samples,
+        inside=inside,
+        n_samples=n_samples,
+        std_error=_std_error(inside, n_samples),
+        n_partials=len(records),
+        compute_seconds=sum(record["elapsed_seconds"] for _, record in records),
+        missing_shards=missing_shards,
+    )
@@ -0,0 +1,190 @@
+"""Detect how many CPUs this process may actually use.
+
+`os.cpu_count()` reports every core on the node, even when the scheduler has
+pinned the job to a few of them or a container caps its CPU time. Using it as
+a worker count oversubscribes shared nodes, so the limits below are combined
+and the smallest one wins:
+
+- CPU affinity (`os.sched_getaffinity`), which reflects Slurm and cgroup cpusets;
+- a cgroup v2 `cpu.max` or cgroup v1 `cpu.cfs_quota_us` CPU-time quota;
+- Slurm's `SLURM_CPUS_PER_TASK`.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import math
+import os
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# Environment variables read by OpenMP and the common BLAS builds when their
+# thread pools are created. Pool workers set these so that N workers do not
+# each start one BLAS thread per core.
+THREAD_LIMIT_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+@dataclass(frozen=True)
+class CpuResources:
+    """CPU limits found for this process; `None` means no limit was found.
+
+    `cpus` is the smallest of the limits and `source` names the one that set it.
+    """
+
+    cpus: int
+    source: str
+    node_cpus: int
+    affinity: Optional[int]
+    cgroup_quota: Optional[float]
+    slurm: Optional[int]
+
+
+def affinity_cpus() -> Optional[int]:
+    """Return the number of CPUs this process may be scheduled on."""
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        # sched_getaffinity is not available on macOS or Windows.
+        return None
+
+
+def _parse_cpu_max(text: str) -> Optional[float]:
+    """Parse a cgroup v2 `cpu.max` line such as "200000 100000" or "max 100000"."""
+
+    quota, _, period = text.strip().partition(" ")
+    if quota == "max" or not period:
+        return None
+    return int(quota) / int(period)
+
+
+def _cgroup_paths() -> Dict[str, str]:
+    """Map each cgroup controller (or "" for cgroup v2) to this process's path."""
+
+    paths = {}
+    try:
+        lines = Path("/proc/self/cgroup").read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return paths
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        for controller in controllers.split(","):
+            paths[controller] = path
+    return paths
+
+
+def _quota_in(
+    directory: Path, root: Path, read_quota: Callable[[Path], Optional[float]]
+) -> Optional[float]:
+    """Return the tightest quota from `directory` up to the hierarchy `root`."""
+
+    quotas = []
+    while True:
+        try:
+            quota = read_quota(directory)
+        except (OSError, ValueError):
+            quota = None
+        if quota is not None:
+            quotas.append(quota)
+        if directory == root or root not in directory.parents:
+            break
+        directory = directory.parent
+    return min(quotas) if quotas else None
+
+
+def _read_v1_quota(directory: Path) -> Optional[float]:
+    quota = int((directory / "cpu.cfs_quota_us").read_text(encoding="utf-8"))
+    period = int((directory / "cpu.cfs_period_us").read_text(encoding="utf-8"))
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def _read_v2_quota(directory: Path) -> Optional[float]:
+    return _parse_cpu_max((directory / "cpu.max").read_text(encoding="utf-8"))
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """Return the cgroup CPU-time quota in CPUs (may be fractional), if any."""
+
+    paths = _cgroup_paths()
+    if "" in paths:
+        relative = paths[""].lstrip("/")
+        quota = _quota_in(CGROUP_ROOT / relative, CGROUP_ROOT, _read_v2_quota)
+        if quota is not None:
+            return quota
+    # Hybrid hosts list a v2 entry but still account CPU time in v1.
+    if "cpu" in paths:
+        for mount in ("cpu,cpuacct", "cpuacct,cpu", "cpu"):
+            root = CGROUP_ROOT / mount
+            if root.is_dir():
+                directory = root / paths["cpu"].lstrip("/")
+                # Inside a container the host path is not visible; the
+                # container's own cgroup is mounted at the root instead.
+                if not directory.is_dir():
+                    directory = root
+                return _quota_in(directory, root, _read_v1_quota)
+    return None
+
+
+def slurm_cpus() -> Optional[int]:
+    """Return the CPUs Slurm allocated per task, if running under Slurm."""
+
+    value = os.getenv("SLURM_CPUS_PER_TASK", "")
+    return int(value) if value.isdigit() and int(value) > 0 else None
+
+
+def detect_cpus() -> CpuResources:
+    """Combine affinity, cgroup quota and Slurm limits into one CPU count."""
+
+    node_cpus = os.cpu_count() or 1
+    affinity = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    slurm = slurm_cpus()
+
+    candidates = [(node_cpus, "cpu_count")]
+    if affinity is not None:
+        candidates.append((affinity, "affinity"))
+    if quota is not None:
+        # A quota of 2.5 CPUs still keeps three workers busy most of the time.
+        candidates.append((math.ceil(quota), "cgroup quota"))
+    if slurm is not None:
+        candidates.append((slurm, "SLURM_CPUS_PER_TASK"))
+    cpus, source = min(candidates, key=lambda candidate: candidate[0])
+    return CpuResources(
+        cpus=max(1, cpus),
+        source=source,
+        node_cpus=node_cpus,
+        affinity=affinity,
+        cgroup_quota=quota,
+        slurm=slurm,
+    )
+
+
+def available_workers() -> int:
+    """Return the number of worker processes this job can keep busy."""
+
+    return detect_cpus().cpus
+
+
+def limit_worker_threads(threads: int = 1) -> None:
+    """Cap OpenMP/BLAS threads in the current process.
+
+    Used as the initializer of pool worker processes. The environment variables
+    cover libraries loaded later; threadpoolctl, when installed, also resizes
+    thread pools that NumPy's BLAS has already started.
+    """
+
+    for variable in THREAD_LIMIT_VARIABLES:
+        os.environ[variable] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(threads)
@@ -0,0 +1,167 @@
+"""Durable progress for long runs that may be preempted.
+
+Every logical block of a run has its own RNG stream, so the position of a
+run's streams is simply the set of blocks already counted. `RunState` records
+those blocks and their inside count in a JSON state file, rewritten atomically
+at most every `interval_seconds`. A restarted run with the same settings skips
+the recorded blocks, so its final count is identical to an uninterrupted run.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import json
+import os
+import signal
+import time
+
+STATE_FORMAT = "mc_sim.state/1"
+
+BlockRange = Tuple[int, int]
+
+
+class Preempted(Exception):
+    """Raised in the main thread when the job is told to stop (e.g. SIGTERM)."""
+
+    def __init__(self, signum: int) -> None:
+        super().__init__(f"received signal {signum}")
+        self.signum = signum
+
+
+@contextmanager
+def raise_on_signals(*signums: int) -> Iterator[None]:
+    """Turn the given signals (default SIGTERM) into `Preempted` exceptions.
+
+    Slurm sends SIGTERM when a job is preempted or hits its time limit and
+    kills it after the grace period; raising lets `finally` blocks flush state.
+    """
+
+    def handler(signum: int, frame: Any) -> None:
+        raise Preempted(signum)
+
+    signums = signums or (signal.SIGTERM,)
+    previous = {signum: signal.signal(signum, handler) for signum in signums}
+    try:
+        yield
+    finally:
+        for signum, old_handler in previous.items():
+            signal.signal(signum, old_handler)
+
+
+def _merge(ranges: List[BlockRange], new: BlockRange) -> List[BlockRange]:
+    """Insert `new` into sorted, disjoint `ranges`, joining adjacent ranges."""
+
+    merged: List[BlockRange] = []
+    for start, stop in sorted(ranges + [new]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+class RunState:
+    """Completed blocks and counts of one run, persisted to `path`.
+
+    Load happens on construction, so `saved_entropy` can seed an unseeded run
+    with the entropy of the run being resumed. `begin` then checks that the
+    file belongs to the same run.
+    """
+
+    def __init__(self, path: Path, *, interval_seconds: float = 60.0) -> None:
+        if interval_seconds < 0:
+            raise ValueError("interval_seconds must be non-negative")
+        self.path = Path(path)
+        self.interval_seconds = interval_seconds
+        self.run: Optional[Dict[str, Any]] = None
+        # (completed block ranges, inside, samples), replaced as one object so
+        # a signal arriving mid-update can never flush a torn state.
+        self._progress: Tuple[List[BlockRange], int, int] = ([], 0, 0)
+        self._saved: Optional[Dict[str, Any]] = None
+        self._last_flush = time.monotonic()
+        if self.path.exists():
+            record = json.loads(self.path.read_text(encoding="utf-8"))
+            if record.get("format") != STATE_FORMAT:
+                raise ValueError(f"{self.path} is not a {STATE_FORMAT} state file")
+            self._saved = record
+
+    @property
+    def saved_entropy(self) -> Optional[int]:
+        """Root seed entropy of the run stored in the state file, if any."""
+
+        return None if self._saved is None else self._saved["run"]["entropy"]
+
+    @property
+    def inside(self) -> int:
+        return self._progress[1]
+
+    @property
+    def samples(self) -> int:
+        return self._progress[2]
+
+    def begin(self, run: Dict[str, Any]) -> None:
+        """Start or resume `run`, described by its result-defining settings."""
+
+        if self._saved is not None:
+            if self._saved["run"] != run:
+                raise ValueError(
+                    f"{self.path} belongs to a different run "
+                    f"({self._saved['run']}); remove it or change --state-file"
+                )
+            self._progress = (
+                [tuple(block_range) for block_range in self._saved["completed_blocks"]],
+                self._saved["inside"],
+                self._saved["samples"],
+            )
+        self.run = run
+
+    def remaining(self, blocks: BlockRange) -> List[BlockRange]:
+        """Return the parts of `blocks` not yet counted."""
+
+        gaps = []
+        start, stop = blocks
+        for done_start, done_stop in self._progress[0]:
+            if done_start > start:
+                gaps.append((start, min(done_start, stop)))
+            start = max(start, done_stop)
+            if start >= stop:
+                break
+        if start < stop:
+            gaps.append((start, stop))
+        return [gap for gap in gaps if gap[0] < gap[1]]
+
+    def record(self, block_range: BlockRange, inside: int, samples: int) -> None:
+        """Add one finished task; flush if the interval has elapsed."""
+
+        ranges, total_inside, total_samples = self._progress
+        self._progress = (
+            _merge(ranges, block_range),
+            total_inside + inside,
+            total_samples + samples,
+        )
+        if time.monotonic() - self._last_flush >= self.interval_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Atomically replace the state file with the current progress."""
+
+        if self.run is None:
+            return
+        ranges, inside, samples = self._progress
+        record = {
+            "format": STATE_FORMAT,
+            "run": self.run,
+            "completed_blocks": [list(block_range) for block_range in ranges],
+            "inside": inside,
+            "samples": samples,
+            "updated": time.time(),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(record, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_flush = time.monotonic()
@@ -0,0 +1,239 @@
+"""Point samplers for the streaming Monte Carlo kernel.
+
+Every sampler fills a preallocated `(size, 2)` buffer with points in
+[0, 1]^2 for one logical block at a time. Fills may be split into chunks of any
+size without changing which points a block produces, which keeps seeded runs
+independent of `chunk_size` and the worker count.
+"""
+
+from typing import Any, Callable, Optional
+
+import math
+import numpy as np
+import warnings
+
+PointArray = Any  # NumPy typing requires optional dependencies; keep it generic for simplicity.
+
+PointFiller = Callable[[int, PointArray], None]  # (offset within block, out buffer)
+
+# "random": i.i.d. uniform points.
+# "stratified": one jittered point per cell of the largest square grid that fits
+#   in the block, remaining points i.i.d.
+# "antithetic": each uniform point (x, y) is paired with (1 - x, 1 - y).
+# "sobol": scrambled Sobol' points; blocks take disjoint index ranges of one
+#   sequence, so workers never overlap (requires SciPy).
+SAMPLERS = ("random", "stratified", "antithetic", "sobol")
+
+# Every 2**20 sample indices start a new, independently scrambled Sobol'
+# sequence (SciPy allows at most 2**30 points per scramble). Reaching an index
+# means `fast_forward`ing the engine, which costs time proportional to the
+# distance skipped, so the period is kept to one task of `PROGRESS_TASK_BLOCKS`
+# blocks: such tasks start at a scramble boundary and skip nothing, and no task
+# ever skips more than one period, keeping Sobol' runs linear in n. Each
+# scramble is still a full 2**20-point net. Block sizes must divide this so a
+# block never straddles two scrambles.
+SOBOL_POINTS_PER_SCRAMBLE = 2**20
+
+# Coordinate types for the "random" sampler, trading precision for memory
+# bandwidth. Each type draws points from a lattice with 2**bits values per axis
+# and tests the lattice corner, which biases the π estimate upwards by at most
+# 8 / 2**bits (about two boundary cells per lattice row):
+# "float64": 53-bit lattice; bias below 1e-15.
+# "float32": 24-bit lattice (8 bytes per point instead of 16); lattice bias below
+#   5e-7, plus float32 rounding of x*x + y*y near the arc of the same order, so
+#   |bias| < 1e-6 overall.
+# "uint32": coordinates x / 2**32 tested exactly as x*x + y*y <= 2**64 in uint64
+#   arithmetic; bias below 2**-29 (about 1.9e-9).
+POINT_DTYPES = ("float64", "float32", "uint32")
+
+# Blocks and chunks draw Sobol' points in arbitrary counts; the points are the
+# same either way, so SciPy's reminder that balance needs powers of two is
+# noise. A filter rather than `catch_warnings`, which is not thread-safe.
+warnings.filterwarnings(
+    "ignore",
+    message="The balance properties of Sobol' points require n to be a power of 2",
+    category=UserWarning,
+)
+
+
+class ScratchBuffers:
+    """Buffers a task allocates once and reuses for every chunk it processes."""
+
+    def __init__(
+        self, size: int, *, sampler: str = "random", dtype: str = "float64"
+    ) -> None:
+        self.points = np.empty((size, 2), dtype=dtype)
+        if dtype == "uint32":
+            # The exact integer test needs the squares in uint64.
+            self.squares = np.empty((size, 2), dtype=np.uint64)
+            self.distances = np.empty(size, dtype=np.uint64)
+        else:
+            # Float points are squared in place once they have been generated.
+            self.squares = self.points
+            self.distances = np.empty(size, dtype=dtype)
+        self.mask = np.empty(size, dtype=bool)
+        self.cell_index: Optional[PointArray] = None
+        self.cells: Optional[PointArray] = None
+        # Created by the first Sobol' block of a task and reused by the rest.
+        self.sobol: Optional["SobolStream"] = None
+        if sampler == "stratified":
+            self.cell_index = np.arange(size, dtype=np.float64)
+            self.cells = np.empty(size)
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+
+def scratch_size(chunk_size: int, block_samples: int, sampler: str) -> int:
+    """Return the buffer length to use for chunks of at most `chunk_size` points.
+
+    Antithetic pairs must not be split across chunks, so when a block needs
+    more than one chunk the buffer length is rounded up to an even number.
+    """
+
+    size = min(chunk_size, block_samples)
+    if sampler == "antithetic" and size % 2 and size < block_samples:
+        size += 1
+    return size
+
+
+def random_uint32_points(rng: np.random.Generator, n_samples: int) -> PointArray:
+    """Return `(n_samples, 2)` uint32 coordinates, one raw 64-bit draw per point.
+
+    The generator has no `out=` for integers, and splitting raw words is about
+    twice as fast as `Generator.integers`.
+    """
+
+    raw = rng.bit_generator.random_raw(n_samples)
+    return raw.view(np.uint32).reshape(n_samples, 2)
+
+
+def _random_filler(rng: np.random.Generator) -> PointFiller:
+    def fill(start: int, out: PointArray) -> None:
+        if out.dtype == np.uint32:
+            out[...] = random_uint32_points(rng, len(out))
+        else:
+            rng.random(out=out, dtype=out.dtype)
+
+    return fill
+
+
+def _antithetic_filler(rng: np.random.Generator) -> PointFiller:
+    def fill(start: int, out: PointArray) -> None:
+        size = len(out)
+        drawn = (size + 1) // 2
+        rng.random(out=out[:drawn])
+        np.subtract(1.0, out[: size - drawn], out=out[drawn:])
+
+    return fill
+
+
+def _stratified_filler(
+    rng: np.random.Generator, block_samples: int, scratch: ScratchBuffers
+) -> PointFiller:
+    grid = math.isqrt(block_samples)
+    n_cells = grid * grid
+
+    def fill(start: int, out: PointArray) -> None:
+        rng.random(out=out)
+        stratified = min(len(out), n_cells - start)
+        if stratified <= 0:
+            return
+        # Cell k of the grid is (k // grid, k % grid); shift the jitter into it.
+        rows = scratch.cells[:stratified]
+        cols = scratch.distances[:stratified]
+        np.add(scratch.cell_index[:stratified], start, out=rows)
+        np.divmod(rows, grid, out=(rows, cols))
+        jittered = out[:stratified]
+        np.add(jittered[:, 0], rows, out=jittered[:, 0])
+        np.add(jittered[:, 1], cols, out=jittered[:, 1])
+        np.divide(jittered, grid, out=jittered)
+
+    return fill
+
+
+class SobolStream:
+    """One task's position in the run's scrambled Sobol' sequences.
+
+    `engine.fast_forward` costs time proportional to the distance skipped, so
+    re-creating the engine for every block made runs quadratic in their length.
+    A task's blocks are consecutive, so only its first block (and each new
+    scramble) fast-forwards; later blocks continue from the same engine.
+    """
+
+    def __init__(self, entropy: Any) -> None:
+        try:
+            from scipy.stats import qmc
+        except ImportError as exc:
+            raise ImportError(
+                "scipy is required for sampler='sobol'. "
+                "Install it or choose another sampler."
+            ) from exc
+        self._qmc = qmc
+        self.entropy = entropy
+        self.engine: Any = None
+        self.next_index = -1
+
+    def seek(self, index: int) -> None:
+        """Position the stream at global sample `index`."""
+
+        continuing = self.engine is not None and index == self.next_index
+        if continuing and index % SOBOL_POINTS_PER_SCRAMBLE:
+            return
+        scramble, offset = divmod(index, SOBOL_POINTS_PER_SCRAMBLE)
+        # Length-2 spawn keys never collide with the length-1 keys of block streams.
+        scramble_rng = np.random.default_rng(
+            np.random.SeedSequence(self.entropy, spawn_key=(scramble, 0))
+        )
+        self.engine = self._qmc.Sobol(d=2, scramble=True, seed=scramble_rng)
+        if offset:
+            self.engine.fast_forward(offset)
+        self.next_index = index
+
+    def fill(self, out: PointArray) -> None:
+        out[...] = self.engine.random(len(out))
+        self.next_index += len(out)
+
+
+def _sobol_filler(
+    entropy: Any, first_index: int, scratch: ScratchBuffers
+) -> PointFiller:
+    if scratch.sobol is None or scratch.sobol.entropy != entropy:
+        scratch.sobol = SobolStream(entropy)
+    stream = scratch.sobol
+    stream.seek(first_index)
+
+    def fill(start: int, out: PointArray) -> None:
+        stream.fill(out)
+
+    return fill
+
+
+def point_filler(
+    sampler: str,
+    rng: np.random.Generator,
+    *,
+    entropy: Any,
+    first_index: int,
+    block_samples: int,
+    scratch: ScratchBuffers,
+) -> PointFiller:
+    """Return a function that fills successive chunks of one logical block.
+
+    `rng` is the block's own generator, `first_index` the global index of the
+    block's first sample, and `entropy` the run's root seed entropy. Only the
+    "random" sampler supports coordinate dtypes other than float64.
+    """
+
+    if sampler != "random" and scratch.points.dtype != np.float64:
+        raise ValueError(f"sampler={sampler!r} requires dtype='float64'")
+
+    if sampler == "random":
+        return _random_filler(rng)
+    if sampler == "antithetic":
+        return _antithetic_filler(rng)
+    if sampler == "stratified":
+        return _stratified_filler(rng, block_samples, scratch)
+    if sampler == "sobol":
+        return _sobol_filler(entropy, first_index, scratch)
+    raise ValueError(f"sampler must be one of {', '.join(SAMPLERS)}")
@@ -1,77 +1,1217 @@
 """Monte Carlo helpers for estimating π."""
 
+from dataclasses import dataclass, field
 from functools import partial
-from typing import Any
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
+import asyncio
 import concurrent.futures
+import math
 import numpy as np
+import os
+import pickle
+import statistics
+import threading
+import time
 import warnings
 
+from .resources import available_workers, limit_worker_threads
+from .runstate import RunState
+from .samplers import (
+    POINT_DTYPES,
+    SAMPLERS,
+    ScratchBuffers,
+    point_filler,
+    random_uint32_points,
+    scratch_size,
+)
+from .tracing import Recorder, TraceEvent, Tracer
+
 PointArray = Any  # NumPy typing requires optional dependencies; keep it generic for simplicity.
 
 MIN_ROBUST_SAMPLES = 10_000
 
+# Points generated per pass of the streaming kernel. 64Ki points keep the
+# coordinate and distance buffers at roughly 1.5 MiB per worker, no matter how
+# many samples are requested in total.
+DEFAULT_CHUNK_SIZE = 65_536
+
+# Samples per logical RNG block. Block `i` always draws from the `i`-th child of
+# the run's SeedSequence, and blocks (not workers) are the unit handed out to
+# the pool, so a seeded count does not depend on `num_workers` or `chunk_size`.
+# Changing this value changes which numbers a given seed produces.
+BLOCK_SIZE = 65_536
+
+BlockRange = Tuple[int, int]  # half-open range of logical block indices
+
+# Logical blocks per task when sampling until a target standard error. Batches
+# are accepted strictly in block order, so a seeded adaptive run stops at the
+# same sample count no matter how many workers produced the batches.
+ADAPTIVE_BATCH_BLOCKS = 4
+
+# Logical blocks per task when progress is saved to a state file or streamed
+# by `estimate_pi_async` and no `task_blocks` is given. Progress is recorded
+# per finished task, so this sets its granularity and bounds the work redone
+# after a preemption (about a million samples per task).
+PROGRESS_TASK_BLOCKS = 16
+
+# "static" hands each worker one equal contiguous share of the blocks up front;
+# "dynamic" submits many small tasks so fast workers pull more of the work.
+SCHEDULES = ("static", "dynamic")
+
+# Dynamic scheduling aims for tasks of about this many seconds when the task
+# size is chosen automatically, but always leaves several tasks per worker so a
+# slow or descheduled worker cannot hold up the end of the run.
+TARGET_TASK_SECONDS = 0.02
+MIN_TASKS_PER_WORKER = 4
+
+# "processes" sidesteps the GIL entirely; "threads" avoids spawn and pickling
+# costs and still scales because NumPy's Generator fills and ufuncs release the
+# GIL while they run.
+BACKENDS = ("processes", "threads")
+
+# Tasks kept in flight per worker by `MonteCarloSession.run_tasks`: enough to
+# keep every worker busy while results are collected, without queueing the
+# whole run up front.
+IN_FLIGHT_PER_WORKER = 4
+
+
+def random_unit_points(
+    n_samples: int,
+    *,
+    rng: Optional[np.random.Generator] = None,
+    out: Optional[PointArray] = None,
+    dtype: str = "float64",
+) -> PointArray:
+    """Return `n_samples` points sampled uniformly inside [0, 1]^2.
+
+    `dtype` is one of `POINT_DTYPES`; "uint32" points are integer coordinates
+    `x` standing for `x / 2**32`. If `out` is given it must be a C-contiguous
+    array of that dtype and shape `(n_samples, 2)`; it is filled in place and
+    returned.
+    """
+
+    if dtype not in POINT_DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(POINT_DTYPES)}")
+    if rng is None:
+        rng = np.random.default_rng()
+    if dtype == "uint32":
+        points = random_uint32_points(rng, n_samples)
+        if out is None:
+            return points
+        out[...] = points
+        return out
+    if out is None:
+        return rng.random((n_samples, 2), dtype=dtype)
+    rng.random(out=out, dtype=dtype)
+    return out
+
+
+def count_inside_points(
+    points: PointArray, *, scratch: Optional[ScratchBuffers] = None
+) -> int:
+    """Return how many of the provided points lie inside the quarter circle.
+
+    The test runs in the precision of `points` (see `random_unit_points`);
+    uint32 coordinates are tested exactly as `x*x + y*y <= 2**64` in uint64.
+    Passing `scratch` (at least `len(points)` long, with the same dtype) avoids
+    every temporary, but float `points` are overwritten with their squares.
+    """
+
+    size = len(points)
+    if scratch is None:
+        scratch = ScratchBuffers(size, dtype=points.dtype.name)
+        if scratch.squares is scratch.points:
+            scratch.squares = np.empty_like(points)
+
+    squares = scratch.squares[:size]
+    np.multiply(points, points, out=squares, dtype=squares.dtype)
+    distances = np.add(squares[:, 0], squares[:, 1], out=scratch.distances[:size])
+    if points.dtype == np.uint32:
+        # Each square is below 2**64, so the sum is inside exactly when it does
+        # not wrap around (x*x + y*y == 2**64 has no solution in range).
+        inside = np.greater_equal(distances, squares[:, 0], out=scratch.mask[:size])
+    else:
+        inside = np.less_equal(distances, 1.0, out=scratch.mask[:size])
+    return int(np.count_nonzero(inside))
+
+
+def _count_inside_streaming(
+    n_samples: int,
+    fill_points: Any,
+    scratch: ScratchBuffers,
+    recorder: Optional[Recorder] = None,
+) -> int:
+    """Count inside points chunk by chunk, reusing one set of scratch buffers."""
+
+    buffer_size = len(scratch)
+
+    inside = 0
+    done = 0
+    while done < n_samples:
+        size = min(n_samples - done, buffer_size)
+        points = scratch.points[:size]
+        if recorder is None:
+            fill_points(done, points)
+            inside += count_inside_points(points, scratch=scratch)
+        else:
+            start = time.perf_counter()
+            fill_points(done, points)
+            filled = time.perf_counter()
+            inside += count_inside_points(points, scratch=scratch)
+            recorder.add("fill", start, filled, samples=size)
+            recorder.add("reduce", filled, time.perf_counter(), samples=size)
+        done += size
+    return inside
+
+
+def _block_rng(entropy: Any, block_index: int) -> np.random.Generator:
+    """Return the generator for one logical block of a run.
+
+    This is the `block_index`-th child that `SeedSequence(entropy).spawn` would
+    produce, built directly so blocks can be seeded independently in any worker.
+    """
+
+    seed_sequence = np.random.SeedSequence(entropy, spawn_key=(block_index,))
+    return np.random.default_rng(seed_sequence)
+
+
+def _block_count(n_samples: int) -> int:
+    """Return how many logical blocks a run of `n_samples` samples spans."""
+
+    return -(-n_samples // BLOCK_SIZE)
+
+
+def _block_samples(block_index: int, n_samples: int) -> int:
+    """Return how many samples belong to logical block `block_index`."""
+
+    return min(BLOCK_SIZE, n_samples - block_index * BLOCK_SIZE)
 
-def random_unit_points(n_samples: int) -> PointArray:
-    """Return `n_samples` points sampled uniformly inside [0, 1]^2."""
 
-    rng = np.random.default_rng()
-    return rng.random((n_samples, 2))
+def _range_samples(block_range: BlockRange, n_samples: int) -> int:
+    """Return how many samples the blocks in `block_range` cover."""
 
+    first_block, stop_block = block_range
+    return min(stop_block * BLOCK_SIZE, n_samples) - first_block * BLOCK_SIZE
 
-def count_inside_points(points: PointArray) -> int:
-    """Return how many of the provided points lie inside the quarter circle."""
 
-    distances_squared = np.sum(points * points, axis=1)
-    return int(np.count_nonzero(distances_squared <= 1.0))
+def _split_blocks(block_range: BlockRange, n_tasks: int) -> List[BlockRange]:
+    """Split the logical blocks in `block_range` into `n_tasks` contiguous ranges."""
 
+    start, stop_block = block_range
+    base, remainder = divmod(stop_block - start, n_tasks)
+    ranges = []
+    for idx in range(n_tasks):
+        stop = start + base + (1 if idx < remainder else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
 
-def _count_inside_chunk(n_samples: int, *, use_vectorized: bool = True) -> int:
-    """Return how many random points fall inside the quarter circle for one chunk."""
 
-    rng = np.random.default_rng()
+def _std_error(inside: int, n_samples: int) -> float:
+    """Return the binomial standard error of `4 * inside / n_samples`."""
+
+    hit_rate = inside / n_samples
+    return 4 * math.sqrt(hit_rate * (1 - hit_rate) / n_samples)
+
+
+def _target_met(inside: int, n_samples: int, target_std_error: float) -> bool:
+    """Return whether enough samples were drawn to trust the running error."""
+
+    return (
+        n_samples >= MIN_ROBUST_SAMPLES
+        and _std_error(inside, n_samples) <= target_std_error
+    )
+
+
+def _count_inside_chunk(
+    block_range: BlockRange,
+    *,
+    n_samples: int,
+    entropy: Any,
+    use_vectorized: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    sampler: str = "random",
+    dtype: str = "float64",
+    recorder: Optional[Recorder] = None,
+) -> int:
+    """Return how many random points fall inside the quarter circle for one chunk.
+
+    A chunk is a contiguous range of logical blocks out of a run of `n_samples`
+    samples whose RNG streams derive from `entropy`. Pass a `recorder` to time
+    every phase of every chunk (see `mc_sim.tracing`).
+    """
+
+    first_block, stop_block = block_range
+    scratch = None
     if use_vectorized:
-        points = random_unit_points(n_samples)
-        return count_inside_points(points)
+        start = time.perf_counter()
+        scratch = ScratchBuffers(
+            scratch_size(chunk_size, min(BLOCK_SIZE, n_samples), sampler),
+            sampler=sampler,
+            dtype=dtype,
+        )
+        if recorder is not None:
+            recorder.add("scratch", start, time.perf_counter(), size=len(scratch))
 
     inside = 0
-    for _ in range(n_samples):
-        x, y = rng.random(2)
-        inside += int(x * x + y * y <= 1.0)
+    for block_index in range(first_block, stop_block):
+        start = time.perf_counter() if recorder is not None else 0.0
+        rng = _block_rng(entropy, block_index)
+        block_samples = _block_samples(block_index, n_samples)
+        if scratch is not None:
+            fill_points = point_filler(
+                sampler,
+                rng,
+                entropy=entropy,
+                first_index=block_index * BLOCK_SIZE,
+                block_samples=block_samples,
+                scratch=scratch,
+            )
+            if recorder is not None:
+                recorder.add("seed", start, time.perf_counter(), block=block_index)
+            inside += _count_inside_streaming(
+                block_samples, fill_points, scratch, recorder
+            )
+            continue
+        for _ in range(block_samples):
+            x, y = rng.random(2)
+            inside += int(x * x + y * y <= 1.0)
+        if recorder is not None:
+            recorder.add("loop", start, time.perf_counter(), block=block_index)
     return inside
 
 
-def estimate_pi(n_samples: int, *, num_workers: int = 1, use_vectorized: bool = True) -> float:
-    """Return a Monte Carlo estimate of π using `n_samples` random points."""
+# (kernel result, worker label, seconds, trace events or None when not tracing).
+# The result is an inside count for π and [sum, sum of squares] for integrals.
+TaskResult = Tuple[Any, str, float, Optional[List[TraceEvent]]]
 
-    if n_samples <= 0:
-        raise ValueError("n_samples must be a positive integer")
+# A kernel processes one range of logical blocks inside a worker; it receives
+# `n_samples` and `entropy` plus its own options, and an optional `recorder`.
+Kernel = Callable[..., Any]
+
+
+def _worker_label() -> str:
+    """Identify the process and thread running the current task."""
+
+    return f"{os.getpid()}/{threading.current_thread().name}"
+
+
+def _run_task(
+    block_range: BlockRange,
+    *,
+    kernel: Kernel = _count_inside_chunk,
+    trace: bool = False,
+    **kwargs: Any,
+) -> TaskResult:
+    """Run `kernel` on `block_range` and report which worker ran it and for how long.
+
+    With `trace=True` the task also returns the worker's trace events.
+    """
+
+    start = time.perf_counter()
+    if not trace:
+        value = kernel(block_range, **kwargs)
+        return value, _worker_label(), time.perf_counter() - start, None
+
+    recorder = Recorder()
+    value = kernel(block_range, recorder=recorder, **kwargs)
+    end = time.perf_counter()
+    recorder.add("task", start, end, blocks=list(block_range))
+    result = (value, _worker_label(), end - start, recorder.events)
+    # Time serializing the result as the pool will before sending it back.
+    pickle.dumps(result)
+    recorder.add("pickle", end, time.perf_counter())
+    return result
+
+
+def _auto_task_blocks(seconds_per_block: float, n_blocks: int, num_workers: int) -> int:
+    """Choose blocks per task from the measured latency of one block."""
+
+    by_latency = round(TARGET_TASK_SECONDS / max(seconds_per_block, 1e-9))
+    by_balance = n_blocks // (MIN_TASKS_PER_WORKER * num_workers)
+    return max(1, min(by_latency, by_balance))
+
+
+class _Tally:
+    """Running totals for one run, including the samples each worker drew.
+
+    `total` sums the kernel results: the inside count for π, or the
+    `[sum, sum of squares]` array of an integral.
+    """
+
+    def __init__(
+        self,
+        n_samples: int,
+        tracer: Optional[Tracer] = None,
+        state: Optional[RunState] = None,
+    ) -> None:
+        self.n_samples = n_samples
+        self.tracer = tracer
+        self.state = state
+        # A resumed run starts from the counts already saved in its state file.
+        self.total = state.inside if state is not None else 0
+        self.consumed = state.samples if state is not None else 0
+        self.resumed = self.consumed
+        self.n_tasks = 0
+        self.worker_samples: Dict[str, int] = {}
+
+    def add(self, block_range: BlockRange, result: TaskResult) -> None:
+        value, worker, _, events = result
+        if self.tracer is not None and events:
+            self.tracer.extend(events)
+        samples = _range_samples(block_range, self.n_samples)
+        self.total += value
+        self.consumed += samples
+        self.n_tasks += 1
+        self.worker_samples[worker] = self.worker_samples.get(worker, 0) + samples
+        if self.state is not None:
+            self.state.record(block_range, value, samples)
+
+
+@dataclass(frozen=True)
+class PiEstimate:
+    """Outcome of one Monte Carlo π run.
+
+    `n_samples` is the number of samples actually consumed. For adaptive runs,
+    `max_samples` is the budget the run was allowed and `seconds_saved` projects
+    how much wall time stopping early saved versus sampling all of it.
+    `worker_samples` maps each worker (`pid/thread`) to the samples it drew,
+    which makes load imbalance between workers visible. `entropy` is the root
+    seed entropy actually used, so unseeded runs can be reproduced; sharded
+    runs record their `shard` as `(index, count)`. `blocks` is the
+    `(first, stop)` range of logical RNG blocks the samples were drawn from,
+    so two results with the same entropy and overlapping blocks share samples.
+    `resumed_samples` counts the samples restored from a state file rather than
+    drawn by this call.
+    """
+
+    estimate: float
+    inside: int
+    n_samples: int
+    elapsed_seconds: float
+    target_std_error: Optional[float] = None
+    max_samples: Optional[int] = None
+    n_tasks: int = 0
+    worker_samples: Dict[str, int] = field(default_factory=dict)
+    entropy: Optional[int] = None
+    shard: Optional[Tuple[int, int]] = None
+    resumed_samples: int = 0
+    blocks: Optional[BlockRange] = None
+
+    @property
+    def std_error(self) -> float:
+        """Binomial standard error of `estimate`.
+
+        This assumes i.i.d. samples, so for the variance-reduced samplers it
+        is a conservative (typically loose) bound.
+        """
+
+        return _std_error(self.inside, self.n_samples)
+
+    @property
+    def seconds_saved(self) -> float:
+        """Projected wall time saved compared with sampling `max_samples`."""
+
+        if self.max_samples is None:
+            return 0.0
+        return self.elapsed_seconds * (self.max_samples / self.n_samples - 1)
+
+    @property
+    def load_imbalance(self) -> float:
+        """Samples drawn by the busiest worker relative to the mean (1.0 is even)."""
+
+        if not self.worker_samples:
+            return 1.0
+        counts = self.worker_samples.values()
+        return max(counts) / statistics.mean(counts)
+
+
+def _warm_up(_: int) -> int:
+    """Trivial task used to force a pool worker to start and import NumPy."""
+
+    return os.getpid()
+
+
+Item = TypeVar("Item")
+
+
+class TaskStream(Generic[Item]):
+    """Iterator over `(item, result)` pairs returned by `MonteCarloSession.run_tasks`.
+
+    Items are usually block ranges. Results arrive in completion order. Use it
+    as a context manager, or call `close`, so tasks that have not started are
+    cancelled if the caller stops early; `close` may be called from another
+    thread while this one waits for a result.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[concurrent.futures.Executor],
+        task: Callable[[Item], Any],
+        items: Iterable[Item],
+        max_pending: int,
+    ) -> None:
+        self._executor = executor
+        self._task = task
+        self._items = iter(items)
+        self._max_pending = max_pending
+        self._pending: Dict[concurrent.futures.Future, Item] = {}
+        self._done: List[concurrent.futures.Future] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self) -> "TaskStream[Item]":
+        return self
+
+    def __enter__(self) -> "TaskStream[Item]":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __next__(self) -> Tuple[Item, Any]:
+        if self._executor is None:
+            # No pool: run each task inline, in order.
+            if self._closed:
+                raise StopIteration
+            item = next(self._items)
+            return item, self._task(item)
+        while not self._done:
+            with self._lock:
+                while not self._closed and len(self._pending) < self._max_pending:
+                    item = next(self._items, None)
+                    if item is None:
+                        break
+                    self._pending[self._executor.submit(self._task, item)] = item
+                if self._closed or not self._pending:
+                    raise StopIteration
+                pending = list(self._pending)
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            self._done.extend(done)
+        # `close` may be iterating `_pending` in another thread, so pop under the lock.
+        with self._lock:
+            if self._closed:
+                raise StopIteration
+            future = self._done.pop()
+            item = self._pending.pop(future)
+        return item, future.result()
+
+    def close(self) -> None:
+        """Stop submitting and cancel the tasks that have not started."""
+
+        with self._lock:
+            self._closed = True
+            for future in list(self._pending):
+                future.cancel()
+
+
+class MonteCarloSession:
+    """A long-lived worker pool that can serve many π estimates.
+
+    `backend` selects a process pool or a thread pool (see `BACKENDS`). Every
+    task creates its own `Generator` and scratch buffers, so threads never share
+    RNG state. Use the session as a context manager so the pool is started once
+    and shut down when the block exits::
+
+        with MonteCarloSession(num_workers=8) as session:
+            for _ in range(10):
+                session.estimate_pi(5_000_000)
+
+    `num_workers=None` uses every CPU this job may use (see
+    `mc_sim.resources.available_workers`). Process workers cap their own
+    OpenMP/BLAS thread pools at one thread so N workers never start N*N threads.
+
+    `startup_seconds` records how long it took to spawn and warm the workers,
+    so callers can report it separately from compute time. With a `tracer`,
+    pool startup and every run on the session are traced (see `mc_sim.tracing`).
+    """
+
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        *,
+        backend: str = "processes",
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        if num_workers is None:
+            num_workers = available_workers()
+        if num_workers <= 0:
+            raise ValueError("num_workers must be a positive integer")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+        self.num_workers = num_workers
+        self.backend = backend
+        self.tracer = tracer
+        self.startup_seconds = 0.0
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._closed = False
+
+    def __enter__(self) -> "MonteCarloSession":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def start(self) -> float:
+        """Spawn and warm the worker pool; return the startup time in seconds."""
+
+        if self._closed:
+            raise RuntimeError("MonteCarloSession is closed")
+        if self._executor is None and self.num_workers > 1:
+            start = time.perf_counter()
+            if self.backend == "threads":
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.num_workers
+                )
+            else:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    initializer=limit_worker_threads,
+                    initargs=(1,),
+                )
+            # Workers may be spawned lazily, so run one trivial task per worker to
+            # pay process startup and imports here instead of in the first estimate.
+            list(self._executor.map(_warm_up, range(self.num_workers)))
+            end = time.perf_counter()
+            self.startup_seconds = end - start
+            if self.tracer is not None:
+                self.tracer.add(
+                    "pool_startup", start, end, workers=self.num_workers
+                )
+        return self.startup_seconds
+
+    def close(self, *, wait: bool = True) -> None:
+        """Shut down the worker pool. The session cannot be reused afterwards.
+
+        With `wait=False`, queued tasks are cancelled and the call returns
+        without waiting for running tasks to finish.
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+        self._closed = True
+
+    def count_inside(
+        self,
+        n_samples: int,
+        *,
+        use_vectorized: bool = True,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        seed: Optional[int] = None,
+        sampler: str = "random",
+        dtype: str = "float64",
+        schedule: str = "static",
+        task_blocks: Optional[int] = None,
+    ) -> int:
+        """Return how many of `n_samples` random points fall inside the quarter circle.
+
+        With the same `seed`, the count is identical for any worker count,
+        backend, schedule, or `chunk_size`. See `simulate_pi` for `schedule`
+        and `task_blocks`.
+        """
+
+        return self._count_fixed(
+            n_samples,
+            entropy=np.random.SeedSequence(seed).entropy,
+            blocks=(0, _block_count(n_samples)),
+            schedule=schedule,
+            task_blocks=task_blocks,
+            use_vectorized=use_vectorized,
+            chunk_size=chunk_size,
+            sampler=sampler,
+            dtype=dtype,
+        ).total
+
+    def count_inside_adaptive(
+        self,
+        target_std_error: float,
+        max_samples: int,
+        *,
+        use_vectorized: bool = True,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        seed: Optional[int] = None,
+        sampler: str = "random",
+        dtype: str = "float64",
+    ) -> Tuple[int, int]:
+        """Sample batches until the standard error reaches `target_std_error`.
+
+        Returns `(inside, n_samples)` for the samples actually consumed, which is
+        at most `max_samples`. Up to two batches per worker are kept in flight;
+        once the target is met, batches that have not started are cancelled.
+        """
+
+        tally = self._count_adaptive(
+            target_std_error,
+            max_samples,
+            entropy=np.random.SeedSequence(seed).entropy,
+            use_vectorized=use_vectorized,
+            chunk_size=chunk_size,
+            sampler=sampler,
+            dtype=dtype,
+        )
+        return tally.total, tally.consumed
+
+    def bind_task(
+        self,
+        n_samples: int,
+        *,
+        entropy: Any,
+        tracer: Optional[Tracer] = None,
+        **kernel_options: Any,
+    ) -> Callable[[BlockRange], TaskResult]:
+        """Return the task that counts one block range of a run.
+
+        The task is picklable, so it can be passed to `run_tasks` on either
+        backend. `kernel_options` go to the kernel (`kernel` selects it).
+        """
+
+        return partial(
+            _run_task,
+            n_samples=n_samples,
+            entropy=entropy,
+            trace=tracer is not None,
+            **kernel_options,
+        )
+
+    def run_tasks(
+        self, task: Callable[[Item], Any], items: Iterable[Item]
+    ) -> TaskStream[Item]:
+        """Run `task` on every item, yielding `(item, result)` as tasks finish.
+
+        At most `IN_FLIGHT_PER_WORKER` tasks per worker are in flight, so
+        `items` may be a lazy iterator. A session with one worker runs the
+        tasks inline, in order. Use the returned stream as a context manager
+        so an early exit cancels the tasks that have not started.
+        """
+
+        self.start()
+        return TaskStream(
+            self._executor, task, items, IN_FLIGHT_PER_WORKER * self.num_workers
+        )
+
+    def _executor_or_start(self) -> concurrent.futures.Executor:
+        self.start()
+        assert self._executor is not None
+        return self._executor
+
+    def _run_all(
+        self,
+        task: Callable[[BlockRange], TaskResult],
+        block_ranges: Iterable[BlockRange],
+        tally: _Tally,
+    ) -> None:
+        with self.run_tasks(task, block_ranges) as results:
+            for block_range, result in results:
+                tally.add(block_range, result)
+
+    def _count_fixed(
+        self,
+        n_samples: int,
+        *,
+        entropy: Any,
+        blocks: BlockRange,
+        schedule: str,
+        task_blocks: Optional[int],
+        tracer: Optional[Tracer] = None,
+        state: Optional[RunState] = None,
+        **kernel_options: Any,
+    ) -> _Tally:
+        """Count the logical `blocks` of a run of `n_samples` samples.
+
+        With a `state`, blocks it already holds are skipped and the rest run
+        as dynamically scheduled tasks so progress is recorded as they finish.
+        """
+
+        task = self.bind_task(
+            n_samples, entropy=entropy, tracer=tracer, **kernel_options
+        )
+        tally = _Tally(n_samples, tracer, state)
+        if state is not None:
+            size = task_blocks or PROGRESS_TASK_BLOCKS
+            block_ranges = [
+                (start, min(start + size, stop))
+                for gap_start, stop in state.remaining(blocks)
+                for start in range(gap_start, stop, size)
+            ]
+            if min(self.num_workers, len(block_ranges)) <= 1:
+                for block_range in block_ranges:
+                    tally.add(block_range, task(block_range))
+            else:
+                self._run_all(task, block_ranges, tally)
+            return tally
+
+        first_block, stop_block = blocks
+        actual_workers = min(self.num_workers, stop_block - first_block)
+        if actual_workers == 1:
+            tally.add(blocks, task(blocks))
+            return tally
+
+        executor = self._executor_or_start()
+        if schedule == "static":
+            block_ranges = _split_blocks(blocks, actual_workers)
+            for block_range, result in zip(block_ranges, executor.map(task, block_ranges)):
+                tally.add(block_range, result)
+            return tally
+
+        if task_blocks is None:
+            # Probe with one block per worker to measure per-block latency.
+            probes = [
+                (block, block + 1)
+                for block in range(first_block, first_block + actual_workers)
+            ]
+            probe_seconds = []
+            for block_range, result in zip(probes, executor.map(task, probes)):
+                tally.add(block_range, result)
+                probe_seconds.append(result[2])
+            first_block += actual_workers
+            task_blocks = _auto_task_blocks(
+                statistics.median(probe_seconds),
+                stop_block - first_block,
+                actual_workers,
+            )
+        block_ranges = (
+            (start, min(start + task_blocks, stop_block))
+            for start in range(first_block, stop_block, task_blocks)
+        )
+        self._run_all(task, block_ranges, tally)
+        return tally
+
+    def _count_adaptive(
+        self,
+        target_std_error: float,
+        max_samples: int,
+        *,
+        entropy: Any,
+        tracer: Optional[Tracer] = None,
+        **kernel_options: Any,
+    ) -> _Tally:
+        task = self.bind_task(
+            max_samples, entropy=entropy, tracer=tracer, **kernel_options
+        )
+        tally = _Tally(max_samples, tracer)
+        n_blocks = _block_count(max_samples)
+        batches = [
+            (start, min(start + ADAPTIVE_BATCH_BLOCKS, n_blocks))
+            for start in range(0, n_blocks, ADAPTIVE_BATCH_BLOCKS)
+        ]
+
+        if min(self.num_workers, len(batches)) == 1:
+            for batch in batches:
+                tally.add(batch, task(batch))
+                if _target_met(tally.total, tally.consumed, target_std_error):
+                    break
+            return tally
+
+        executor = self._executor_or_start()
+        pending: Dict[int, concurrent.futures.Future] = {}
+        finished: Dict[int, TaskResult] = {}
+        next_submit = 0
+        next_accept = 0
+        try:
+            while next_accept < len(batches):
+                while next_submit < len(batches) and len(pending) < 2 * self.num_workers:
+                    pending[next_submit] = executor.submit(task, batches[next_submit])
+                    next_submit += 1
+                concurrent.futures.wait(
+                    pending.values(), return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for idx in [idx for idx, future in pending.items() if future.done()]:
+                    finished[idx] = pending.pop(idx).result()
+                while next_accept in finished:
+                    tally.add(batches[next_accept], finished.pop(next_accept))
+                    next_accept += 1
+                    if _target_met(tally.total, tally.consumed, target_std_error):
+                        return tally
+        finally:
+            for future in pending.values():
+                future.cancel()
+        return tally
+
+    def simulate_pi(self, n_samples: Optional[int] = None, **kwargs: Any) -> PiEstimate:
+        """Run `simulate_pi` on this session's pool."""
+
+        return simulate_pi(n_samples, session=self, **kwargs)
+
+    def estimate_pi(self, n_samples: Optional[int] = None, **kwargs: Any) -> float:
+        """Return a Monte Carlo estimate of π computed on this session's pool."""
+
+        return estimate_pi(n_samples, session=self, **kwargs)
+
+
+def _check_kernel_options(
+    use_vectorized: bool, chunk_size: int, sampler: str, dtype: str
+) -> None:
+    """Validate the options passed through to `_count_inside_chunk`."""
+
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer")
+    if sampler not in SAMPLERS:
+        raise ValueError(f"sampler must be one of {', '.join(SAMPLERS)}")
+    if sampler != "random" and not use_vectorized:
+        raise ValueError(f"sampler={sampler!r} requires use_vectorized=True")
+    if dtype not in POINT_DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(POINT_DTYPES)}")
+    if dtype != "float64" and (sampler != "random" or not use_vectorized):
+        raise ValueError(
+            f"dtype={dtype!r} requires the vectorized 'random' sampler"
+        )
+
+
+def simulate_pi(
+    n_samples: Optional[int] = None,
+    *,
+    num_workers: Optional[int] = None,
+    use_vectorized: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    backend: str = "processes",
+    seed: Optional[int] = None,
+    sampler: str = "random",
+    dtype: str = "float64",
+    schedule: str = "static",
+    task_blocks: Optional[int] = None,
+    target_std_error: Optional[float] = None,
+    max_samples: Optional[int] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    session: Optional[MonteCarloSession] = None,
+    tracer: Optional[Tracer] = None,
+    state: Optional[RunState] = None,
+) -> PiEstimate:
+    """Run a Monte Carlo π simulation and return the estimate with run details.
+
+    The vectorized path streams samples through fixed-size buffers of
+    `chunk_size` points, so peak memory per worker does not grow with
+    `n_samples`.
+
+    Samples are drawn in logical blocks of `BLOCK_SIZE`, each with its own
+    stream spawned from `SeedSequence(seed)`. The same `seed` therefore gives a
+    bit-identical estimate for any `num_workers`, `backend`, or `chunk_size`;
+    `seed=None` draws fresh OS entropy.
+
+    `sampler` picks how points are placed inside each block (see `SAMPLERS`).
+    The variance-reduced samplers reach a given error with far fewer samples
+    than i.i.d. "random" points; they require the vectorized path.
+
+    `dtype` selects the coordinate type of the vectorized "random" sampler:
+    "float32" halves memory traffic and "uint32" tests integer coordinates
+    exactly, at a worst-case bias of about 1e-6 and 2e-9 respectively (see
+    `POINT_DTYPES` in `mc_sim.samplers`).
+
+    `schedule="static"` gives each worker one equal share of the blocks up
+    front. `schedule="dynamic"` submits tasks of `task_blocks` blocks as workers
+    free up, so one slow core or a noisy neighbour cannot set the total
+    runtime; with `task_blocks=None` the task size is chosen from the measured
+    latency of a first probe block per worker. Adaptive runs always schedule
+    their batches dynamically.
+
+    Either pass a fixed `n_samples`, or pass `target_std_error` and
+    `max_samples` to keep sampling batches only until the standard error of the
+    estimate drops to the target.
+
+    `shard=(index, count)` runs only shard `index` of `count` contiguous slices
+    of the run's blocks, e.g. one Slurm array task per shard. Given the same
+    `seed`, the shards' counts sum to exactly the count of an unsharded run;
+    see `mc_sim.partials` for saving and merging shard results.
+
+    `num_workers=None` uses every CPU this job may use, taking CPU affinity,
+    cgroup quotas and Slurm allocations into account (see `mc_sim.resources`).
+    `backend` chooses between a process pool and a thread pool when
+    `num_workers > 1`. Pass an open `MonteCarloSession` as `session` to reuse
+    its warm worker pool; the worker count and backend then come from the
+    session and `num_workers`/`backend` are ignored.
+    Without a session, a temporary pool is started and shut down for this call.
+
+    Pass a `Tracer` as `tracer` (or open the session with one) to record
+    per-chunk, per-phase timings from every worker; see `mc_sim.tracing`.
+
+    Pass a `RunState` as `state` to save completed blocks to a state file as
+    the run progresses and to resume from it after an interruption; a resumed
+    run gives the same count as an uninterrupted one. With `seed=None`, a
+    resumed run reuses the entropy stored in the state file. The state is
+    flushed when the call returns or raises (including `Preempted`).
+    """
+
+    if target_std_error is None:
+        if n_samples is None or n_samples <= 0:
+            raise ValueError("n_samples must be a positive integer")
+        if max_samples is not None:
+            raise ValueError("max_samples requires target_std_error")
+        budget = n_samples
+    else:
+        if n_samples is not None:
+            raise ValueError("pass max_samples instead of n_samples with target_std_error")
+        if target_std_error <= 0:
+            raise ValueError("target_std_error must be positive")
+        if max_samples is None or max_samples <= 0:
+            raise ValueError("max_samples must be a positive integer")
+        budget = max_samples
+    if num_workers is None:
+        num_workers = available_workers() if session is None else session.num_workers
     if num_workers <= 0:
         raise ValueError("num_workers must be a positive integer")
+    _check_kernel_options(use_vectorized, chunk_size, sampler, dtype)
+    if schedule not in SCHEDULES:
+        raise ValueError(f"schedule must be one of {', '.join(SCHEDULES)}")
+    if task_blocks is not None and task_blocks <= 0:
+        raise ValueError("task_blocks must be a positive integer")
+    blocks = (0, _block_count(budget))
+    if shard is not None:
+        shard_index, shard_count = shard
+        if target_std_error is not None:
+            raise ValueError("shard cannot be combined with target_std_error")
+        if shard_count <= 0 or not 0 <= shard_index < shard_count:
+            raise ValueError("shard must be (index, count) with 0 <= index < count")
+        if shard_count > blocks[1]:
+            raise ValueError(
+                f"{budget} samples span only {blocks[1]} blocks of {BLOCK_SIZE}; "
+                f"use at most that many shards"
+            )
+        blocks = _split_blocks(blocks, shard_count)[shard_index]
+    if state is not None and target_std_error is not None:
+        raise ValueError("state cannot be combined with target_std_error")
 
-    if n_samples < MIN_ROBUST_SAMPLES:
+    if budget < MIN_ROBUST_SAMPLES:
         warnings.warn(
-            f"{n_samples} samples may be too low for a robust π estimate; "
+            f"{budget} samples may be too low for a robust π estimate; "
             f"consider using at least {MIN_ROBUST_SAMPLES} samples.",
             stacklevel=2,
         )
 
-    actual_workers = min(num_workers, n_samples)
-    if actual_workers == 1:
-        inside = _count_inside_chunk(n_samples, use_vectorized=use_vectorized)
+    if seed is None and state is not None and state.saved_entropy is not None:
+        entropy = state.saved_entropy
     else:
-        base, remainder = divmod(n_samples, actual_workers)
-        chunk_sizes = [
-            base + (1 if idx < remainder else 0) for idx in range(actual_workers)
-        ]
-        chunk_worker = partial(_count_inside_chunk, use_vectorized=use_vectorized)
-        with concurrent.futures.ProcessPoolExecutor(
-            max_workers=actual_workers
-        ) as executor:
-            inside_counts = list(executor.map(chunk_worker, chunk_sizes))
-        inside = sum(inside_counts)
-
-    return 4 * inside / n_samples
+        entropy = np.random.SeedSequence(seed).entropy
+    if state is not None:
+        # Only settings that change the count identify the run.
+        state.begin(
+            {
+                "n_samples": budget,
+                "entropy": entropy,
+                "sampler": sampler,
+                "dtype": dtype,
+                "shard": list(shard) if shard is not None else None,
+            }
+        )
+    kernel_options = {
+        "use_vectorized": use_vectorized,
+        "chunk_size": chunk_size,
+        "sampler": sampler,
+        "dtype": dtype,
+    }
+
+    def run(active: MonteCarloSession) -> Tuple[_Tally, float]:
+        active_tracer = tracer if tracer is not None else active.tracer
+        start = time.perf_counter()
+        if target_std_error is None:
+            try:
+                tally = active._count_fixed(
+                    budget,
+                    entropy=entropy,
+                    blocks=blocks,
+                    schedule=schedule,
+                    task_blocks=task_blocks,
+                    tracer=active_tracer,
+                    state=state,
+                    **kernel_options,
+                )
+            finally:
+                if state is not None:
+                    state.flush()
+        else:
+            tally = active._count_adaptive(
+                target_std_error,
+                budget,
+                entropy=entropy,
+                tracer=active_tracer,
+                **kernel_options,
+            )
+        end = time.perf_counter()
+        if active_tracer is not None:
+            active_tracer.add("run", start, end, samples=tally.consumed)
+        return tally, end - start
+
+    if session is None:
+        with MonteCarloSession(
+            min(num_workers, blocks[1] - blocks[0]), backend=backend, tracer=tracer
+        ) as temporary:
+            tally, elapsed = run(temporary)
+    else:
+        tally, elapsed = run(session)
+
+    return PiEstimate(
+        estimate=4 * tally.total / tally.consumed,
+        inside=tally.total,
+        n_samples=tally.consumed,
+        elapsed_seconds=elapsed,
+        target_std_error=target_std_error,
+        max_samples=max_samples,
+        n_tasks=tally.n_tasks,
+        worker_samples=tally.worker_samples,
+        entropy=entropy,
+        shard=shard,
+        resumed_samples=tally.resumed,
+        # Adaptive runs consume whole batches of blocks in order from block 0.
+        blocks=blocks if target_std_error is None else (0, _block_count(tally.consumed)),
+    )
+
+
+def estimate_pi(n_samples: Optional[int] = None, **kwargs: Any) -> float:
+    """Return a Monte Carlo estimate of π using `n_samples` random points.
+
+    Accepts the same keyword arguments as `simulate_pi`, including
+    `target_std_error`/`max_samples` for adaptive precision, and returns only
+    the estimate.
+    """
+
+    return simulate_pi(n_samples, **kwargs).estimate
+
+
+@dataclass(frozen=True)
+class PiProgress:
+    """One progress event from `estimate_pi_async`.
+
+    `estimate` and `std_error` use the samples finished so far. The last event
+    has `done=True` and carries the complete `result`.
+    """
+
+    samples_done: int
+    n_samples: int
+    inside: int
+    elapsed_seconds: float
+    done: bool = False
+    result: Optional[PiEstimate] = None
+
+    @property
+    def estimate(self) -> float:
+        return 4 * self.inside / self.samples_done
+
+    @property
+    def std_error(self) -> float:
+        return _std_error(self.inside, self.samples_done)
+
+    @property
+    def fraction_done(self) -> float:
+        return self.samples_done / self.n_samples
+
+
+async def estimate_pi_async(
+    n_samples: int,
+    *,
+    num_workers: Optional[int] = None,
+    use_vectorized: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    backend: str = "processes",
+    seed: Optional[int] = None,
+    sampler: str = "random",
+    dtype: str = "float64",
+    task_blocks: Optional[int] = None,
+    session: Optional[MonteCarloSession] = None,
+) -> AsyncIterator[PiProgress]:
+    """Estimate π on a worker pool, yielding a `PiProgress` as each task finishes.
+
+    Tasks of `task_blocks` blocks (default `PROGRESS_TASK_BLOCKS`) are
+    dispatched to the session's pool without blocking the event loop::
+
+        async for progress in estimate_pi_async(10**9, seed=1):
+            print(f"{progress.fraction_done:.0%}: {progress.estimate:.6f}")
+        result = progress.result
+
+    Cancelling the consuming task (or closing the iterator early) cancels all
+    queued tasks immediately; tasks already running in a worker process finish
+    in the background and their results are discarded. A temporary pool is
+    shut down without waiting. The final estimate is identical to
+    `simulate_pi` with the same `seed`; the other arguments match it too.
+    """
+
+    if n_samples is None or n_samples <= 0:
+        raise ValueError("n_samples must be a positive integer")
+    if num_workers is None:
+        num_workers = available_workers() if session is None else session.num_workers
+    if num_workers <= 0:
+        raise ValueError("num_workers must be a positive integer")
+    _check_kernel_options(use_vectorized, chunk_size, sampler, dtype)
+    if task_blocks is not None and task_blocks <= 0:
+        raise ValueError("task_blocks must be a positive integer")
+
+    entropy = np.random.SeedSequence(seed).entropy
+    kernel_options = {
+        "use_vectorized": use_vectorized,
+        "chunk_size": chunk_size,
+        "sampler": sampler,
+        "dtype": dtype,
+    }
+    n_blocks = _block_count(n_samples)
+    size = task_blocks or PROGRESS_TASK_BLOCKS
+    block_ranges = iter(
+        [(start, min(start + size, n_blocks)) for start in range(0, n_blocks, size)]
+    )
+
+    loop = asyncio.get_running_loop()
+    owned = session is None
+    active = session or MonteCarloSession(min(num_workers, n_blocks), backend=backend)
+    results: Optional[TaskStream[BlockRange]] = None
+    try:
+        # Spawning processes blocks, so do it off the event loop.
+        await loop.run_in_executor(None, active.start)
+        task = active.bind_task(
+            n_samples, entropy=entropy, tracer=active.tracer, **kernel_options
+        )
+        tally = _Tally(n_samples, active.tracer)
+        results = active.run_tasks(task, block_ranges)
+        start = time.perf_counter()
+        while True:
+            # Waiting for the next result blocks, so do it off the event loop too.
+            # Without a pool the task itself runs there, one at a time.
+            item = await loop.run_in_executor(None, next, results, None)
+            if item is None:
+                break
+            tally.add(*item)
+            if tally.consumed < n_samples:
+                yield PiProgress(
+                    samples_done=tally.consumed,
+                    n_samples=n_samples,
+                    inside=tally.total,
+                    elapsed_seconds=time.perf_counter() - start,
+                )
+    finally:
+        if results is not None:
+            # Safe while a default-executor thread still waits on the stream.
+            results.close()
+        if owned:
+            active.close(wait=False)
+
+    elapsed = time.perf_counter() - start
+    yield PiProgress(
+        samples_done=tally.consumed,
+        n_samples=n_samples,
+        inside=tally.total,
+        elapsed_seconds=elapsed,
+        done=True,
+        result=PiEstimate(
+            estimate=4 * tally.total / tally.consumed,
+            inside=tally.total,
+            n_samples=tally.consumed,
+            elapsed_seconds=elapsed,
+            n_tasks=tally.n_tasks,
+            worker_samples=tally.worker_samples,
+            entropy=entropy,
+        ),
+    )
 
 
 if __name__ == "__main__":
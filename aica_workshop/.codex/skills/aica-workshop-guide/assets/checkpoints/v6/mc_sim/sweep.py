@@ -0,0 +1,321 @@
+"""Run a grid of π estimates on one shared worker pool.
+
+Launching `run_sim.py` once per configuration pays interpreter startup, the
+NumPy import and pool spawn every time, which dwarfs the compute of small
+runs. `run_sweep` instead splits every configuration into tasks, interleaves
+the tasks of all configurations round-robin on one warm pool, and hands back
+one row per configuration as soon as its last task finishes.
+"""
+
+from itertools import chain, product, zip_longest
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import csv
+import math
+import sys
+import time
+
+import numpy as np
+
+from .samplers import POINT_DTYPES, SAMPLERS
+from .simulate import (
+    PROGRESS_TASK_BLOCKS,
+    BlockRange,
+    MonteCarloSession,
+    TaskResult,
+    _block_count,
+    _check_kernel_options,
+    _std_error,
+    _Tally,
+)
+
+Task = Callable[[BlockRange], TaskResult]
+
+# Sweep keys accepted by `parse_sweep` and the simulate_pi argument each sets.
+SWEEP_KEYS = {
+    "n": "n_samples",
+    "n_samples": "n_samples",
+    "sampler": "sampler",
+    "dtype": "dtype",
+    "vectorized": "use_vectorized",
+    "chunk_size": "chunk_size",
+}
+
+ROW_FIELDS = (
+    "n_samples",
+    "seed",
+    "sampler",
+    "dtype",
+    "use_vectorized",
+    "chunk_size",
+    "estimate",
+    "std_error",
+    "abs_error",
+    "inside",
+    "n_tasks",
+    "compute_seconds",
+    "finished_seconds",
+)
+
+# Rows buffered per Parquet row group; CSV rows are flushed one by one.
+PARQUET_ROWS_PER_GROUP = 256
+
+
+def _parse_count(text: str) -> int:
+    value = float(text)
+    if value != int(value) or value <= 0:
+        raise ValueError(f"{text!r} is not a positive integer")
+    return int(value)
+
+
+def _parse_bool(text: str) -> bool:
+    lowered = text.lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{text!r} is not a boolean")
+
+
+def parse_sweep(spec: str) -> Dict[str, List[Any]]:
+    """Parse "n=1e4,1e5;sampler=random,sobol" into simulate_pi argument lists."""
+
+    grid: Dict[str, List[Any]] = {}
+    for part in filter(None, (part.strip() for part in spec.split(";"))):
+        key, sep, values = part.partition("=")
+        key = key.strip()
+        if not sep or key not in SWEEP_KEYS:
+            raise ValueError(
+                f"expected KEY=V1,V2,... with KEY one of {', '.join(SWEEP_KEYS)}; "
+                f"got {part!r}"
+            )
+        items = [value.strip() for value in values.split(",") if value.strip()]
+        name = SWEEP_KEYS[key]
+        if name in ("n_samples", "chunk_size"):
+            parsed: List[Any] = [_parse_count(item) for item in items]
+        elif name == "use_vectorized":
+            parsed = [_parse_bool(item) for item in items]
+        else:
+            choices = SAMPLERS if name == "sampler" else POINT_DTYPES
+            unknown = [item for item in items if item not in choices]
+            if unknown:
+                raise ValueError(f"{key} must be one of {', '.join(choices)}")
+            parsed = items
+        if not parsed:
+            raise ValueError(f"no values given for {key}")
+        grid[name] = parsed
+    return grid
+
+
+def parse_seeds(spec: str) -> List[int]:
+    """Parse "0..31" (inclusive) or "1,5,9" into a list of seeds."""
+
+    if ".." in spec:
+        first, _, last = spec.partition("..")
+        return list(range(int(first), int(last) + 1))
+    return [int(item) for item in spec.split(",") if item.strip()]
+
+
+def sweep_configs(
+    grid: Dict[str, List[Any]], seeds: Iterable[int], defaults: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Return one simulate_pi argument dict per grid point and seed."""
+
+    names = list(grid)
+    configs = []
+    for values in product(*(grid[name] for name in names)):
+        for seed in seeds:
+            config = {**defaults, **dict(zip(names, values)), "seed": seed}
+            _check_kernel_options(
+                config["use_vectorized"],
+                config["chunk_size"],
+                config["sampler"],
+                config["dtype"],
+            )
+            configs.append(config)
+    return configs
+
+
+def _config_tasks(
+    index: int, config: Dict[str, Any], task: Task, task_blocks: int
+) -> List[Tuple[int, Task, BlockRange]]:
+    n_blocks = _block_count(config["n_samples"])
+    return [
+        (index, task, (start, min(start + task_blocks, n_blocks)))
+        for start in range(0, n_blocks, task_blocks)
+    ]
+
+
+def _run_scheduled(item: Tuple[int, Task, BlockRange]) -> TaskResult:
+    """Run one scheduled `(config index, task, block range)` item."""
+
+    _, task, block_range = item
+    return task(block_range)
+
+
+def run_sweep(
+    session: MonteCarloSession,
+    configs: List[Dict[str, Any]],
+    *,
+    task_blocks: int = PROGRESS_TASK_BLOCKS,
+) -> Iterator[Dict[str, Any]]:
+    """Run every configuration on `session` and yield rows as they complete.
+
+    Each configuration's tasks cover the same blocks a `simulate_pi` call with
+    that seed would, so every row matches the corresponding single run.
+    """
+
+    entropies = [np.random.SeedSequence(config["seed"]).entropy for config in configs]
+    tasks = [
+        session.bind_task(
+            config["n_samples"],
+            entropy=entropy,
+            use_vectorized=config["use_vectorized"],
+            chunk_size=config["chunk_size"],
+            sampler=config["sampler"],
+            dtype=config["dtype"],
+        )
+        for config, entropy in zip(configs, entropies)
+    ]
+    tallies = [_Tally(config["n_samples"]) for config in configs]
+    task_lists = [
+        _config_tasks(index, config, task, task_blocks)
+        for index, (config, task) in enumerate(zip(configs, tasks))
+    ]
+    remaining = [len(task_list) for task_list in task_lists]
+    compute = [0.0] * len(configs)
+    # Round-robin over configurations so small and large runs share the pool.
+    schedule = (
+        item
+        for item in chain.from_iterable(zip_longest(*task_lists))
+        if item is not None
+    )
+    start = time.perf_counter()
+
+    def finish(
+        index: int, block_range: BlockRange, result: TaskResult
+    ) -> Optional[Dict[str, Any]]:
+        tally = tallies[index]
+        tally.add(block_range, result)
+        compute[index] += result[2]
+        remaining[index] -= 1
+        if remaining[index]:
+            return None
+        config = configs[index]
+        estimate = 4 * tally.total / tally.consumed
+        return {
+            "n_samples": config["n_samples"],
+            "seed": config["seed"],
+            "sampler": config["sampler"],
+            "dtype": config["dtype"],
+            "use_vectorized": config["use_vectorized"],
+            "chunk_size": config["chunk_size"],
+            "estimate": estimate,
+            "std_error": _std_error(tally.total, tally.consumed),
+            "abs_error": abs(estimate - math.pi),
+            "inside": tally.total,
+            "n_tasks": tally.n_tasks,
+            "compute_seconds": compute[index],
+            "finished_seconds": time.perf_counter() - start,
+        }
+
+    with session.run_tasks(_run_scheduled, schedule) as results:
+        for (index, _, block_range), result in results:
+            row = finish(index, block_range, result)
+            if row is not None:
+                yield row
+
+
+class RowWriter:
+    """Stream sweep rows to CSV (or stdout) or Parquet, chosen by file suffix.
+
+    Parquet output needs pyarrow and is written one row group per
+    `PARQUET_ROWS_PER_GROUP` rows, so finished rows reach disk while the sweep
+    is still running.
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = None if path is None else Path(path)
+        self._rows: List[Dict[str, Any]] = []
+        self._parquet: Any = None
+        self._handle: Optional[TextIO] = None
+        self._csv: Any = None
+        if self.path is not None and self.path.suffix == ".parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as exc:
+                raise ImportError(
+                    "pyarrow is required for Parquet output. "
+                    "Install it or write a .csv file instead."
+                ) from exc
+            self._pa = pa
+            schema = pa.schema(
+                [
+                    ("n_samples", pa.int64()),
+                    ("seed", pa.int64()),
+                    ("sampler", pa.string()),
+                    ("dtype", pa.string()),
+                    ("use_vectorized", pa.bool_()),
+                    ("chunk_size", pa.int64()),
+                    ("estimate", pa.float64()),
+                    ("std_error", pa.float64()),
+                    ("abs_error", pa.float64()),
+                    ("inside", pa.int64()),
+                    ("n_tasks", pa.int64()),
+                    ("compute_seconds", pa.float64()),
+                    ("finished_seconds", pa.float64()),
+                ]
+            )
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._parquet = pq.ParquetWriter(str(self.path), schema)
+        else:
+            if self.path is None:
+                self._handle = sys.stdout
+            else:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._handle = open(self.path, "w", newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._handle, fieldnames=ROW_FIELDS)
+            self._csv.writeheader()
+
+    def __enter__(self) -> "RowWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self._parquet is None:
+            self._csv.writerow(row)
+            self._handle.flush()
+            return
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROWS_PER_GROUP:
+            self._flush_parquet()
+
+    def _flush_parquet(self) -> None:
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._parquet.schema)
+            self._parquet.write_table(table)
+            self._rows = []
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._flush_parquet()
+            self._parquet.close()
+            self._parquet = None
+        elif self._handle is not None and self._handle is not sys.stdout:
+            self._handle.close()
+        self._handle = None
+
@@ -0,0 +1,128 @@
+"""Opt-in per-phase tracing of Monte Carlo runs.
+
+Pass a `Tracer` to `simulate_pi`/`estimate_pi` (or to a `MonteCarloSession`)
+and every worker records when each chunk spent time in which phase:
+
+- "pool_startup": spawning and warming the worker pool (parent process);
+- "run": one whole `simulate_pi` call (parent process);
+- "task": one task in a worker, enclosing the phases below;
+- "scratch": allocating the task's scratch buffers;
+- "seed": creating a block's generator and point filler;
+- "fill": generating one chunk of points (RNG fill);
+- "reduce": squaring, summing and comparing one chunk (or evaluating and
+  summing the integrand of `mc_sim.integrate.integrate`);
+- "loop": one block of the non-vectorized path;
+- "pickle": serializing the task result for the trip back to the parent.
+
+Timestamps come from `time.perf_counter`, which is the system-wide monotonic
+clock on Linux, so events from different worker processes line up. Without a
+tracer the kernel only pays one `None` check per chunk.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import json
+import os
+import threading
+
+# (name, start seconds, end seconds, pid, thread id, args)
+TraceEvent = Tuple[str, float, float, int, int, Dict[str, Any]]
+
+
+class Recorder:
+    """Collects the trace events of the current process or thread."""
+
+    def __init__(self) -> None:
+        self.events: List[TraceEvent] = []
+
+    def add(self, name: str, start: float, end: float, **args: Any) -> None:
+        self.events.append(
+            (name, start, end, os.getpid(), threading.get_native_id(), args)
+        )
+
+
+@dataclass(frozen=True)
+class PhaseSummary:
+    """Total time spent in one phase across all workers."""
+
+    name: str
+    count: int
+    total_seconds: float
+    mean_seconds: float
+    max_seconds: float
+
+
+class Tracer(Recorder):
+    """Recorder for the parent process that also gathers worker events."""
+
+    def extend(self, events: List[TraceEvent]) -> None:
+        self.events.extend(events)
+
+    def summary(self) -> List[PhaseSummary]:
+        """Aggregate events by phase, longest total first."""
+
+        durations: Dict[str, List[float]] = {}
+        for name, start, end, *_ in self.events:
+            durations.setdefault(name, []).append(end - start)
+        rows = [
+            PhaseSummary(
+                name=name,
+                count=len(values),
+                total_seconds=sum(values),
+                mean_seconds=sum(values) / len(values),
+                max_seconds=max(values),
+            )
+            for name, values in durations.items()
+        ]
+        return sorted(rows, key=lambda row: row.total_seconds, reverse=True)
+
+    def format_summary(self) -> str:
+        """Return the phase summary as a plain-text table."""
+
+        lines = [
+            f"{'Phase':<14}{'Count':>8}{'Total (s)':>12}{'Mean (ms)':>12}{'Max (ms)':>12}"
+        ]
+        for row in self.summary():
+            lines.append(
+                f"{row.name:<14}{row.count:>8}{row.total_seconds:>12.4f}"
+                f"{row.mean_seconds * 1e3:>12.3f}{row.max_seconds * 1e3:>12.3f}"
+            )
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the events in Chrome trace format (also read by Perfetto)."""
+
+        origin = min((event[1] for event in self.events), default=0.0)
+        parent = os.getpid()
+        trace_events: List[Dict[str, Any]] = []
+        for pid in sorted({event[3] for event in self.events}):
+            label = "parent" if pid == parent else f"worker {pid}"
+            trace_events.append(
+                {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}}
+            )
+        for name, start, end, pid, tid, args in self.events:
+            trace_events.append(
+                {
+                    "name": name,
+                    "cat": "mc_sim",
+                    "ph": "X",
+                    "ts": (start - origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """Write the events as Chrome trace JSON.
+
+        Open the file in https://ui.perfetto.dev or chrome://tracing.
+        """
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome_trace()), encoding="utf-8")
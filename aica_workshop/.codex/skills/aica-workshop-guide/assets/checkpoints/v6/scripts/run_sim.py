@@ -1,53 +1,470 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
 import pathlib
+import subprocess
 import sys
-import time
+from typing import List, Optional, Tuple
 
 REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
-from mc_sim.simulate import estimate_pi
+import numpy as np
 
+from mc_sim.partials import merge_partials, write_partial
+from mc_sim.resources import available_workers
+from mc_sim.runstate import Preempted, RunState, raise_on_signals
+from mc_sim.samplers import POINT_DTYPES, SAMPLERS
+from mc_sim.sweep import RowWriter, parse_seeds, parse_sweep, run_sweep, sweep_configs
+from mc_sim.simulate import (
+    BACKENDS,
+    BLOCK_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    PROGRESS_TASK_BLOCKS,
+    SCHEDULES,
+    MonteCarloSession,
+)
+from mc_sim.tracing import Tracer
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="Run Monte Carlo π estimation.")
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parse an `i/N` shard specification."""
+
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard {text!r} is out of range")
+    return index, count
+
+
+def merge_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_sim.py merge",
+        description="Combine partial results written with --partial-out.",
+    )
+    parser.add_argument("partials", nargs="+", type=pathlib.Path)
+    args = parser.parse_args(argv)
+
+    try:
+        merged = merge_partials(args.partials)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+    print(
+        (
+            f"π estimate: {merged.estimate:.6f} ± {merged.std_error:.6f} "
+            f"(n={merged.n_samples}, partials={merged.n_partials}); "
+            f"compute time across shards: {merged.compute_seconds:.3f}s"
+        )
+    )
+    for run, missing in merged.missing_shards.items():
+        print(
+            f"WARNING: run {run} is missing shards {missing}.",
+            file=sys.stderr,
+        )
+    return 0
+
+
+def launch_shards(args: argparse.Namespace) -> int:
+    """Run every shard as a local subprocess, then merge their partials."""
+
+    # All shards must share one seed; draw it here when none was given.
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    # Shards run side by side, so by default they split the CPUs between them.
+    num_workers = args.num_workers
+    if num_workers is None:
+        num_workers = max(1, available_workers() // args.launch_shards)
+    args.partial_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    processes = []
+    for index in range(args.launch_shards):
+        path = args.partial_dir / f"shard_{index:04d}.json"
+        command = [
+            sys.executable,
+            str(pathlib.Path(__file__).resolve()),
+            "--n-samples", str(args.n_samples),
+            "--backend", args.backend,
+            "--schedule", args.schedule,
+            "--sampler", args.sampler,
+            "--dtype", args.dtype,
+            "--seed", str(seed),
+            "--chunk-size", str(args.chunk_size),
+            "--shard", f"{index}/{args.launch_shards}",
+            "--partial-out", str(path),
+        ]  # fmt: skip
+        command += ["--num-workers", str(num_workers)]
+        if args.task_blocks is not None:
+            command += ["--task-blocks", str(args.task_blocks)]
+        if args.no_vectorized:
+            command.append("--no-vectorized")
+        paths.append(path)
+        processes.append(subprocess.Popen(command))
+
+    failed = [index for index, process in enumerate(processes) if process.wait()]
+    if failed:
+        print(f"ERROR: shards {failed} failed.", file=sys.stderr)
+        return 1
+    return merge_main([str(path) for path in paths])
+
+
+def sweep_main(args: argparse.Namespace, parser: argparse.ArgumentParser) -> int:
+    """Run every --sweep configuration and seed on one pool, streaming rows."""
+
+    try:
+        grid = parse_sweep(args.sweep)
+        seeds = parse_seeds(args.seeds) if args.seeds else [args.seed]
+        configs = sweep_configs(
+            grid,
+            seeds,
+            {
+                "n_samples": args.n_samples,
+                "sampler": args.sampler,
+                "dtype": args.dtype,
+                "use_vectorized": not args.no_vectorized,
+                "chunk_size": args.chunk_size,
+            },
+        )
+        writer = RowWriter(args.sweep_out)
+    except (ValueError, ImportError) as exc:
+        parser.error(str(exc))
+
+    with writer, MonteCarloSession(args.num_workers, backend=args.backend) as session:
+        for count, row in enumerate(
+            run_sweep(session, configs, task_blocks=args.task_blocks or PROGRESS_TASK_BLOCKS), 1
+        ):
+            writer.write(row)
+            if args.sweep_out is not None:
+                print(
+                    f"[{count}/{len(configs)}] n={row['n_samples']} "
+                    f"seed={row['seed']} sampler={row['sampler']}: "
+                    f"{row['estimate']:.6f} ± {row['std_error']:.6f}",
+                    file=sys.stderr,
+                )
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "merge":
+        return merge_main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run Monte Carlo π estimation. Use `run_sim.py merge PARTIAL...` to "
+            "combine the partial results of a sharded run."
+        )
+    )
     parser.add_argument(
         "--n-samples",
         type=int,
         default=100_000,
         help="Number of random samples (default: 100000).",
     )
+    parser.add_argument(
+        "--target-std-error",
+        type=float,
+        default=None,
+        help=(
+            "Sample only until the estimate's standard error reaches this value; "
+            "--n-samples is then ignored in favor of --max-samples."
+        ),
+    )
+    parser.add_argument(
+        "--max-samples",
+        type=int,
+        default=1_000_000_000,
+        help="Sample budget for --target-std-error runs (default: 1000000000).",
+    )
     parser.add_argument(
         "--num-workers",
         "-w",
         type=int,
-        default=1,
-        help="Number of worker processes to use (default: 1).",
+        default=None,
+        help=(
+            "Number of workers to use (default: the CPUs this job may use, from "
+            "CPU affinity, cgroup quotas and SLURM_CPUS_PER_TASK; with "
+            "--launch-shards, those CPUs split evenly between the shards)."
+        ),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="processes",
+        help="Run workers as processes or threads (default: processes).",
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=SCHEDULES,
+        default="static",
+        help=(
+            "static: one equal share per worker; dynamic: many small tasks that "
+            "idle workers pull (default: static)."
+        ),
+    )
+    parser.add_argument(
+        "--task-blocks",
+        type=int,
+        default=None,
+        help=(
+            f"Blocks of {BLOCK_SIZE} samples per task for --schedule dynamic "
+            "(default: chosen from measured task latency)."
+        ),
     )
     parser.add_argument(
         "--no-vectorized",
         action="store_true",
         help="Disable NumPy vectorization when counting points.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--sampler",
+        choices=SAMPLERS,
+        default="random",
+        help=(
+            "How points are placed: i.i.d. random, or a variance-reduced "
+            "stratified, antithetic, or Sobol' (needs scipy) sampler "
+            "(default: random)."
+        ),
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=POINT_DTYPES,
+        default="float64",
+        help=(
+            "Coordinate type for the vectorized random sampler; float32 and uint32 "
+            "cut memory traffic at a bias below 1e-6 (default: float64)."
+        ),
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help=(
+            "Seed for reproducible results; the same seed gives the same estimate "
+            "for any worker count (default: fresh entropy)."
+        ),
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=(
+            "Points generated per pass of the vectorized kernel; bounds memory "
+            f"per worker (default: {DEFAULT_CHUNK_SIZE})."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        type=pathlib.Path,
+        default=None,
+        help=(
+            "Record per-chunk, per-phase timings from every worker, write them as "
+            "Chrome trace JSON (open in ui.perfetto.dev) and print a summary."
+        ),
+    )
+    parser.add_argument(
+        "--sweep",
+        default=None,
+        metavar="KEY=V1,V2;...",
+        help=(
+            "Run a grid of configurations on one shared pool, e.g. "
+            "'n=1e4,1e5,1e6;sampler=random,sobol'. Keys: n, sampler, dtype, "
+            "vectorized, chunk_size; other settings come from the usual options."
+        ),
+    )
+    parser.add_argument(
+        "--seeds",
+        default=None,
+        help="Seeds for --sweep, as a range '0..31' or a list '1,5,9'.",
+    )
+    parser.add_argument(
+        "--sweep-out",
+        type=pathlib.Path,
+        default=None,
+        help=(
+            "Stream --sweep rows to this .csv or .parquet (needs pyarrow) file "
+            "(default: CSV on stdout)."
+        ),
+    )
+    parser.add_argument(
+        "--state-file",
+        type=pathlib.Path,
+        default=None,
+        help=(
+            "Save progress to this file and resume from it when rerun with the "
+            "same settings; SIGTERM (e.g. Slurm preemption) flushes it and exits."
+        ),
+    )
+    parser.add_argument(
+        "--state-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between state-file writes (default: 60).",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="INDEX/COUNT",
+        help=(
+            "Run only this slice of the sample budget, e.g. 3/16 for the fourth of "
+            "16 shards; all shards must use the same --seed."
+        ),
+    )
+    parser.add_argument(
+        "--partial-out",
+        type=pathlib.Path,
+        default=None,
+        help="Write this run's raw counts to a JSON partial file for `merge`.",
+    )
+    parser.add_argument(
+        "--launch-shards",
+        type=int,
+        default=None,
+        metavar="COUNT",
+        help=(
+            "Run COUNT shards as local subprocesses and merge their partials "
+            "(requires --partial-dir)."
+        ),
+    )
+    parser.add_argument(
+        "--partial-dir",
+        type=pathlib.Path,
+        default=None,
+        help="Directory for the partial files written by --launch-shards.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.sweep is not None:
+        if args.target_std_error is not None or args.shard is not None:
+            parser.error("--sweep cannot be combined with --target-std-error or --shard")
+        return sweep_main(args, parser)
+    if args.seeds is not None or args.sweep_out is not None:
+        parser.error("--seeds and --sweep-out require --sweep")
+
+    sharded = args.shard is not None or args.launch_shards is not None
+    if sharded and args.target_std_error is not None:
+        parser.error("--target-std-error cannot be combined with sharding")
+    if args.state_file is not None and (
+        args.target_std_error is not None or args.launch_shards is not None
+    ):
+        parser.error(
+            "--state-file cannot be combined with --target-std-error or --launch-shards"
+        )
+    if args.launch_shards is not None:
+        if args.shard is not None or args.partial_dir is None:
+            parser.error("--launch-shards requires --partial-dir and no --shard")
+        if args.launch_shards < 1:
+            parser.error("--launch-shards must be a positive integer")
+        return launch_shards(args)
 
-    start = time.perf_counter()
     use_vectorized = not args.no_vectorized
-    pi_est = estimate_pi(
-        args.n_samples, num_workers=args.num_workers, use_vectorized=use_vectorized
-    )
-    elapsed = time.perf_counter() - start
+    if args.target_std_error is None:
+        sample_args = {
+            "n_samples": args.n_samples,
+            "schedule": args.schedule,
+            "task_blocks": args.task_blocks,
+            "shard": args.shard,
+        }
+        if args.state_file is not None:
+            try:
+                sample_args["state"] = RunState(
+                    args.state_file, interval_seconds=args.state_interval
+                )
+            except ValueError as exc:
+                parser.error(str(exc))
+    else:
+        sample_args = {
+            "target_std_error": args.target_std_error,
+            "max_samples": args.max_samples,
+        }
+    tracer = Tracer() if args.trace is not None else None
+    state = sample_args.get("state")
+    try:
+        # With a state file, SIGTERM unwinds the run so its state is flushed.
+        with raise_on_signals() if state is not None else contextlib.nullcontext():
+            with MonteCarloSession(
+                args.num_workers, backend=args.backend, tracer=tracer
+            ) as session:
+                result = session.simulate_pi(
+                    use_vectorized=use_vectorized,
+                    chunk_size=args.chunk_size,
+                    seed=args.seed,
+                    sampler=args.sampler,
+                    dtype=args.dtype,
+                    **sample_args,
+                )
+    except Preempted as exc:
+        print(
+            (
+                f"Interrupted by signal {exc.signum}; {state.samples} of "
+                f"{args.n_samples} samples saved to {args.state_file}. "
+                "Rerun the same command to resume."
+            ),
+            file=sys.stderr,
+        )
+        return 128 + exc.signum
+    except ValueError as exc:
+        if state is None:
+            raise
+        parser.error(str(exc))
 
+    shard_note = "" if args.shard is None else "shard={}/{}, ".format(*args.shard)
     print(
         (
-            f"π estimate: {pi_est:.6f} (n={args.n_samples}, "
-            f"workers={args.num_workers}, mode={'vectorized' if use_vectorized else 'sequential'}); "
-            f"elapsed: {elapsed:.3f}s"
+            f"π estimate: {result.estimate:.6f} ± {result.std_error:.6f} "
+            f"(n={result.n_samples}, "
+            f"{shard_note}"
+            f"workers={session.num_workers}, backend={args.backend}, sampler={args.sampler}, dtype={args.dtype}, mode={'vectorized' if use_vectorized else 'sequential'}); "
+            f"elapsed: {result.elapsed_seconds:.3f}s (pool startup: {session.startup_seconds:.3f}s)"
         )
     )
+    if len(result.worker_samples) > 1:
+        print(
+            f"Samples per worker ({result.n_tasks} tasks, "
+            f"imbalance {result.load_imbalance:.2f}x):"
+        )
+        for worker, samples in sorted(result.worker_samples.items()):
+            print(f"  {worker}: {samples}")
+    if result.resumed_samples:
+        print(
+            f"Resumed from {args.state_file}: {result.resumed_samples} samples "
+            f"were restored, {result.n_samples - result.resumed_samples} drawn now."
+        )
+    if tracer is not None:
+        tracer.write_chrome_trace(args.trace)
+        print(f"Trace written to {args.trace}")
+        print(tracer.format_summary())
+    if args.partial_out is not None:
+        write_partial(
+            args.partial_out,
+            result,
+            {
+                "n_samples": args.n_samples,
+                "sampler": args.sampler,
+                "dtype": args.dtype,
+                "use_vectorized": use_vectorized,
+                "chunk_size": args.chunk_size,
+            },
+        )
+        print(f"Partial result written to {args.partial_out}")
+    if args.target_std_error is not None:
+        if result.std_error > args.target_std_error:
+            print(
+                (
+                    f"WARNING: target standard error {args.target_std_error} was not "
+                    f"reached within {args.max_samples} samples."
+                ),
+                file=sys.stderr,
+            )
+        print(
+            (
+                f"Adaptive run used {result.n_samples} of {args.max_samples} samples; "
+                f"about {result.seconds_saved:.3f}s saved versus the full budget."
+            )
+        )
     return 0
 
 
@@ -1,125 +1,345 @@
 #!/usr/bin/env python3
 
 import argparse
-import os
+import importlib.util
+import math
 import pathlib
 import statistics
 import sys
-import time
 import warnings
+from typing import List, Optional
 
 REPO_ROOT = pathlib.Path(__file__).resolve().parents[1]
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
-from mc_sim.simulate import estimate_pi
+from mc_sim.benchmark import (
+    SCALING_KINDS,
+    BenchmarkCase,
+    Summary,
+    compare_results,
+    read_results,
+    run_case,
+    run_scaling,
+    scaling_worker_counts,
+    write_results,
+)
+from mc_sim.resources import detect_cpus
+from mc_sim.samplers import POINT_DTYPES, SAMPLERS
+from mc_sim.simulate import BACKENDS, MonteCarloSession
 
 
-def available_workers() -> int:
-    slurm_cpus = os.getenv("SLURM_CPUS_PER_TASK")
-    if slurm_cpus and slurm_cpus.isdigit():
-        return max(1, int(slurm_cpus))
-    return max(1, os.cpu_count() or 1)
+def available_samplers() -> list:
+    if importlib.util.find_spec("scipy") is None:
+        return [sampler for sampler in SAMPLERS if sampler != "sobol"]
+    return list(SAMPLERS)
 
 
-def time_estimate(n_samples: int, *, num_workers: int, use_vectorized: bool) -> float:
-    start = time.perf_counter()
-    estimate_pi(n_samples, num_workers=num_workers, use_vectorized=use_vectorized)
-    return time.perf_counter() - start
+def sampler_accuracy(
+    session: MonteCarloSession, sampler: str, n_samples: int, repeats: int
+) -> dict:
+    """Time `repeats` seeded runs and return mean runtime and RMSE against π."""
+
+    # One untimed run so lazy imports (SciPy for Sobol') are not timed.
+    session.simulate_pi(n_samples, sampler=sampler)
+    timings = []
+    squared_errors = []
+    for seed in range(repeats):
+        result = session.simulate_pi(n_samples, seed=seed, sampler=sampler)
+        timings.append(result.elapsed_seconds)
+        squared_errors.append((result.estimate - math.pi) ** 2)
+    return {
+        "sampler": sampler,
+        "n_samples": n_samples,
+        "mean": statistics.mean(timings),
+        "rmse": math.sqrt(statistics.mean(squared_errors)),
+    }
 
 
 def format_seconds(value: float) -> str:
     return f"{value:.4f}"
 
 
-def main() -> int:
+def format_interval(summary: Summary, fmt: str = ".4f") -> str:
+    return f"{summary.mean:{fmt}} ± {summary.half_width:{fmt}}"
+
+
+def compare_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="run_sim_benchmark.py compare",
+        description=(
+            "Compare samples/s of two benchmark.json files and exit with status 1 "
+            "if any case regressed."
+        ),
+    )
+    parser.add_argument("baseline", type=pathlib.Path, help="Saved baseline results.")
+    parser.add_argument("current", type=pathlib.Path, help="New results to check.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help=(
+            "Relative slowdown tolerated as noise; widened automatically when the "
+            "runs' confidence intervals are wider (default: 0.05)."
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = read_results(args.baseline)
+        current = read_results(args.current)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return report_comparison(baseline, current, args.threshold)
+
+
+def report_comparison(baseline: dict, current: dict, threshold: float) -> int:
+    comparisons = compare_results(baseline, current, threshold)
+    if not comparisons:
+        print("No benchmark cases in common; nothing to compare.")
+        return 0
+    for key in ("hostname", "cpu_model", "git_commit"):
+        before = baseline["environment"].get(key)
+        after = current["environment"].get(key)
+        if before != after:
+            print(f"Note: {key} differs ({before} -> {after}).")
+    width = max(len(item.name) for item in comparisons)
+    print(f"{'Case':<{width}}  {'Baseline/s':>12}  {'Current/s':>12}  {'Change':>8}  Limit")
+    for item in comparisons:
+        flag = "  REGRESSION" if item.regressed else ""
+        print(
+            f"{item.name:<{width}}  {item.baseline:12.4e}  {item.current:12.4e}  "
+            f"{item.change:+8.1%}  -{item.threshold:.1%}{flag}"
+        )
+    regressions = [item for item in comparisons if item.regressed]
+    if regressions:
+        print(
+            f"{len(regressions)} of {len(comparisons)} cases regressed.",
+            file=sys.stderr,
+        )
+        return 1
+    print(f"No regressions across {len(comparisons)} cases.")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        return compare_main(argv[1:])
+
     parser = argparse.ArgumentParser(
-        description="Benchmark Monte Carlo π estimation performance."
+        description=(
+            "Benchmark Monte Carlo π estimation performance. Use "
+            "`run_sim_benchmark.py compare BASELINE CURRENT` to check for regressions."
+        )
     )
     parser.add_argument(
         "--n-samples",
         type=int,
         default=5_000_000,
-        help="Number of random samples (default: 5000000).",
+        help=(
+            "Number of random samples per run; weak scaling gives each worker "
+            "n-samples / max workers (default: 5000000)."
+        ),
     )
     parser.add_argument(
         "--repeats",
         type=int,
         default=10,
-        help="Number of repeats per setting (default: 10).",
+        help="Number of timed repeats per setting (default: 10).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="Untimed runs on each warm pool before timing (default: 1).",
+    )
+    parser.add_argument(
+        "--spawn-repeats",
+        type=int,
+        default=3,
+        help="Number of fresh pools started to time the spawn phase (default: 3).",
     )
     parser.add_argument(
         "--output-dir",
         type=pathlib.Path,
         default=pathlib.Path("results/sim_bench"),
-        help="Directory for plots and markdown output.",
+        help="Directory for plots, markdown and benchmark.json output.",
+    )
+    parser.add_argument(
+        "--num-workers",
+        "-w",
+        type=int,
+        default=None,
+        help=(
+            "Largest worker count to benchmark (default: the CPUs this job may "
+            "use, from CPU affinity, cgroup quotas and SLURM_CPUS_PER_TASK)."
+        ),
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--baseline",
+        type=pathlib.Path,
+        default=None,
+        help="Compare the new results against this benchmark.json when done.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="Noise threshold for --baseline comparisons (default: 0.05).",
+    )
+    args = parser.parse_args(argv)
+    if args.repeats < 1 or args.warmup < 0 or args.spawn_repeats < 1:
+        parser.error("--repeats and --spawn-repeats must be positive, --warmup >= 0")
+
+    resources = detect_cpus()
+    workers_max = args.num_workers or resources.cpus
+    if args.n_samples < workers_max:
+        # Weak scaling gives each worker n_samples // workers_max samples.
+        parser.error(
+            f"--n-samples must be at least the number of workers ({workers_max}) "
+            "so weak scaling has samples for every worker"
+        )
 
     output_dir = args.output_dir
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    workers_max = available_workers()
-    worker_modes = [1]
+    print(
+        f"Using up to {workers_max} worker(s); detected {resources.cpus} usable "
+        f"CPU(s) of {resources.node_cpus} (limited by {resources.source})."
+    )
+    timing = {
+        "warmup": args.warmup,
+        "repeats": args.repeats,
+        "spawn_repeats": args.spawn_repeats,
+    }
+    # A single worker runs inline, so the backend only matters with a pool.
+    settings = [(1, "serial")]
     if workers_max > 1:
-        worker_modes.append(workers_max)
+        settings.extend((workers_max, backend) for backend in BACKENDS)
 
-    summary_rows = []
+    summary_cases = []  # type: List[BenchmarkCase]
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         for use_vectorized in (True, False):
-            for num_workers in worker_modes:
-                timings = [
-                    time_estimate(
-                        args.n_samples,
+            mode = "vectorized" if use_vectorized else "non-vectorized"
+            for num_workers, backend in settings:
+                session_backend = backend if backend in BACKENDS else "processes"
+                summary_cases.append(
+                    run_case(
+                        f"settings/{mode}/{backend}/w{num_workers}/n{args.n_samples}",
+                        "settings",
                         num_workers=num_workers,
+                        backend=session_backend,
+                        n_samples=args.n_samples,
                         use_vectorized=use_vectorized,
+                        **timing,
                     )
-                    for _ in range(args.repeats)
-                ]
-                mean_val = statistics.mean(timings)
-                std_val = (
-                    statistics.stdev(timings)
-                    if len(timings) > 1
-                    else 0.0
                 )
-                summary_rows.append(
-                    {
-                        "mode": "vectorized" if use_vectorized else "non-vectorized",
-                        "workers": num_workers,
-                        "mean": mean_val,
-                        "std": std_val,
-                    }
+
+    worker_counts = scaling_worker_counts(workers_max)
+    scaling_cases = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for kind in SCALING_KINDS:
+            for backend in BACKENDS:
+                scaling_cases[kind, backend] = run_scaling(
+                    kind,
+                    backend,
+                    worker_counts,
+                    args.n_samples if kind == "strong" else args.n_samples // workers_max,
+                    **timing,
                 )
 
-    worker_timings = []
+    dtype_cases = []
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
-        for num_workers in range(1, workers_max + 1):
-            elapsed = time_estimate(
-                args.n_samples,
-                num_workers=num_workers,
-                use_vectorized=True,
-            )
-            worker_timings.append((num_workers, elapsed))
+        for num_workers in sorted({1, workers_max}):
+            for dtype in POINT_DTYPES:
+                dtype_cases.append(
+                    run_case(
+                        f"dtype/{dtype}/w{num_workers}/n{args.n_samples}",
+                        "dtype",
+                        num_workers=num_workers,
+                        backend="processes",
+                        n_samples=args.n_samples,
+                        dtype=dtype,
+                        **timing,
+                    )
+                )
 
-    plot_path = output_dir / "vectorized_workers.png"
+    sampler_sizes = sorted(
+        {max(1, args.n_samples // 100), max(1, args.n_samples // 10), args.n_samples}
+    )
+    sampler_rows = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        with MonteCarloSession(workers_max) as session:
+            for sampler in available_samplers():
+                for n_samples in sampler_sizes:
+                    sampler_rows.append(
+                        sampler_accuracy(session, sampler, n_samples, args.repeats)
+                    )
+
+    all_cases = (
+        summary_cases
+        + [case for cases in scaling_cases.values() for case in cases]
+        + dtype_cases
+    )
+    results_path = output_dir / "benchmark.json"
+    write_results(
+        results_path,
+        all_cases,
+        {
+            "n_samples": args.n_samples,
+            "max_workers": workers_max,
+            "worker_counts": worker_counts,
+            **timing,
+        },
+    )
+
+    plot_path = output_dir / "scaling_efficiency.png"
+    sampler_plot_path = output_dir / "sampler_error.png"
     try:
         import matplotlib.pyplot as plt
 
+        fig, axes = plt.subplots(1, 2, figsize=(11, 4), sharey=True)
+        for axis, kind in zip(axes, SCALING_KINDS):
+            for backend, color in zip(BACKENDS, ("#1f77b4", "#ff7f0e")):
+                cases = scaling_cases[kind, backend]
+                axis.plot(
+                    [case.workers for case in cases],
+                    [case.efficiency for case in cases],
+                    marker="o",
+                    color=color,
+                    label=backend,
+                )
+            axis.axhline(1.0, color="gray", linestyle="--", linewidth=1)
+            axis.set_title(f"{kind.capitalize()} scaling")
+            axis.set_xlabel("Workers")
+            axis.grid(True, alpha=0.3)
+            axis.legend()
+        axes[0].set_ylabel("Parallel efficiency")
+        fig.tight_layout()
+        fig.savefig(plot_path, dpi=150)
+        plt.close(fig)
+
         plt.figure(figsize=(7, 4))
-        plt.plot(
-            [item[0] for item in worker_timings],
-            [item[1] for item in worker_timings],
-            marker="o",
-            color="#1f77b4",
-        )
-        plt.title("Vectorized runtime by worker count")
-        plt.xlabel("Workers")
-        plt.ylabel("Elapsed time (s)")
-        plt.grid(True, alpha=0.3)
+        for sampler in available_samplers():
+            rows = [row for row in sampler_rows if row["sampler"] == sampler]
+            plt.loglog(
+                [row["mean"] for row in rows],
+                [row["rmse"] for row in rows],
+                marker="o",
+                label=sampler,
+            )
+        plt.title("Error vs runtime by sampler")
+        plt.xlabel("Mean elapsed time (s)")
+        plt.ylabel("RMSE of π estimate")
+        plt.legend()
+        plt.grid(True, which="both", alpha=0.3)
         plt.tight_layout()
-        plt.savefig(plot_path, dpi=150)
+        plt.savefig(sampler_plot_path, dpi=150)
         plt.close()
     except ImportError as exc:
         raise SystemExit(
@@ -129,13 +349,56 @@ def main() -> int:
 
     report_path = output_dir / "benchmark_report.md"
     table_lines = [
-        "| Mode | Workers | Mean Time (s) | Std Time (s) |",
-        "| --- | --- | --- | --- |",
+        "| Mode | Workers | Backend | Spawn (s) | Compute (s) | Samples/s |",
+        "| --- | --- | --- | --- | --- | --- |",
     ]
-    for row in summary_rows:
+    for case in summary_cases:
+        mode = "vectorized" if case.options["use_vectorized"] else "non-vectorized"
+        backend = case.name.split("/")[2]
         table_lines.append(
-            f"| {row['mode']} | {row['workers']} | "
-            f"{format_seconds(row['mean'])} | {format_seconds(row['std'])} |"
+            f"| {mode} | {case.workers} | {backend} | "
+            f"{format_interval(case.spawn)} | {format_interval(case.compute)} | "
+            f"{format_interval(case.samples_per_second, '.3e')} |"
+        )
+
+    scaling_lines = [
+        "| Scaling | Backend | Workers | Samples | Compute (s) | Samples/s | Efficiency |",
+        "| --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for (kind, backend), cases in scaling_cases.items():
+        for case in cases:
+            scaling_lines.append(
+                f"| {kind} | {backend} | {case.workers} | {case.n_samples} | "
+                f"{format_interval(case.compute)} | "
+                f"{format_interval(case.samples_per_second, '.3e')} | "
+                f"{case.efficiency:.2f} |"
+            )
+
+    dtype_lines = [
+        "| Dtype | Workers | Compute (s) | Samples/s per core | Speedup vs float64 |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for case in dtype_cases:
+        baseline = next(
+            item
+            for item in dtype_cases
+            if item.workers == case.workers and item.options["dtype"] == "float64"
+        )
+        per_core = case.samples_per_second.mean / case.workers
+        dtype_lines.append(
+            f"| {case.options['dtype']} | {case.workers} | "
+            f"{format_interval(case.compute)} | {per_core:.3e} | "
+            f"{case.samples_per_second.mean / baseline.samples_per_second.mean:.2f}x |"
+        )
+
+    sampler_lines = [
+        "| Sampler | Samples | Mean Time (s) | RMSE |",
+        "| --- | --- | --- | --- |",
+    ]
+    for row in sampler_rows:
+        sampler_lines.append(
+            f"| {row['sampler']} | {row['n_samples']} | "
+            f"{format_seconds(row['mean'])} | {row['rmse']:.2e} |"
         )
 
     report = "\n".join(
@@ -144,27 +407,71 @@ def main() -> int:
             "",
             (
                 "This report summarizes runtime measurements for the Monte Carlo π "
-                "simulation. The first section compares vectorized vs non-vectorized "
-                "implementations on a single core and on all available cores, running "
-                f"each setting {args.repeats} times with {args.n_samples} samples. "
-                "The second section shows how runtime scales with worker count for "
-                "the vectorized implementation (single run per worker count)."
+                "simulation. Every setting is timed in two phases: spawn (starting "
+                f"and warming a fresh pool, {args.spawn_repeats} times) and compute "
+                f"(one estimate on a warm pool, {args.repeats} times after "
+                f"{args.warmup} untimed warm-up run(s)). Values are means ± the "
+                "half-width of a 95% confidence interval. Machine-readable results "
+                f"are in `{results_path.name}`."
+            ),
+            "",
+            (
+                f"The job could use {resources.cpus} of the node's "
+                f"{resources.node_cpus} CPUs (limited by {resources.source}: "
+                f"affinity={resources.affinity}, cgroup quota={resources.cgroup_quota}, "
+                f"SLURM_CPUS_PER_TASK={resources.slurm}); the largest worker count "
+                f"benchmarked is {workers_max}."
             ),
             "",
             "## Timing across settings",
             "",
             "\n".join(table_lines),
             "",
-            "## Vectorized scaling by workers",
+            "## Strong and weak scaling",
+            "",
+            (
+                f"Strong scaling runs {args.n_samples} samples on every worker count; "
+                f"weak scaling gives each worker {args.n_samples // workers_max} "
+                "samples. Efficiency is T1 / (p * Tp) for strong and T1 / Tp for "
+                "weak scaling, from mean compute times."
+            ),
+            "",
+            "\n".join(scaling_lines),
+            "",
+            "![Parallel efficiency by worker count](scaling_efficiency.png)",
+            "",
+            "## Throughput by coordinate dtype",
             "",
-            "![Vectorized runtime by worker count](vectorized_workers.png)",
+            (
+                f"Vectorized random sampling with {args.n_samples} samples. float32 "
+                "and uint32 trade a bias below 1e-6 for less memory traffic per sample."
+            ),
+            "",
+            "\n".join(dtype_lines),
+            "",
+            "## Sampler error vs time",
+            "",
+            (
+                f"Each sampler runs {args.repeats} seeded repeats per sample count on "
+                f"{workers_max} worker(s); RMSE is measured against the true value of π."
+            ),
+            "",
+            "\n".join(sampler_lines),
+            "",
+            "![Error vs runtime by sampler](sampler_error.png)",
         ]
     )
 
     report_path.write_text(report, encoding="utf-8")
 
+    print(f"Wrote results to {results_path}")
     print(f"Wrote report to {report_path}")
     print(f"Wrote plot to {plot_path}")
+    print(f"Wrote plot to {sampler_plot_path}")
+    if args.baseline is not None:
+        return report_comparison(
+            read_results(args.baseline), read_results(results_path), args.threshold
+        )
     return 0
 
 
@@ -1,21 +1,67 @@
 #!/usr/bin/env python3
-"""Apply workshop checkpoints while archiving replaced files."""
+"""Apply workshop checkpoints while archiving replaced files.
+
+Replaced files are archived once per distinct content under
+`.workshop_archives/blobs/`; each apply's archive directory links to them.
+"""
 
 import argparse
+import concurrent.futures
+import hashlib
 import json
+import os
 import shutil
+import stat
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 
 
 SKILL_ROOT = Path(__file__).resolve().parents[1]
 REPO_ROOT = Path(__file__).resolve().parents[4]
 CHECKPOINT_ROOT = SKILL_ROOT / "assets" / "checkpoints"
 MANIFEST_PATH = CHECKPOINT_ROOT / "manifest.json"
-ARCHIVE_ROOT = REPO_ROOT / ".workshop_archives"
+INDEX_PATH = CHECKPOINT_ROOT / "index.json"
+
+# Per-workspace locations, relative to the workspace root.
+ARCHIVE_DIR = ".workshop_archives"
+STAT_CACHE_NAME = ".workshop_cache.json"
+
+PROTECTED_PARTS = {".codex", ".git", ARCHIVE_DIR, STAT_CACHE_NAME, "results"}
+
+INDEX_FORMAT = "checkpoint-index/1"
+STAT_CACHE_FORMAT = "checkpoint-stat-cache/1"
+
+# Files are hashed in 1 MiB reads so large files never sit in memory at once.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files modified this recently are hashed but not cached: a write later in the
+# same mtime tick would leave size and mtime unchanged with different content.
+RACY_SECONDS = 2.0
+
+# Linux ioctl that makes a copy-on-write clone of a file (a reflink) on
+# filesystems that support it, such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+# checkpoint -> relative path -> (size, sha256)
+Index = Dict[str, Dict[str, Tuple[int, str]]]
+
+# (checkpoint file, path relative to the workspace, contents, sha256)
+Asset = Tuple[Path, Path, bytes, str]
 
-PROTECTED_PARTS = {".codex", ".git", ".workshop_archives", "results"}
+CHANGES = ("new", "changed", "unchanged")
+
+ApplyResult = NamedTuple(
+    "ApplyResult",
+    [
+        ("root", Path),
+        ("changes", List[str]),
+        ("archive_dir", Optional[Path]),
+        ("links", Dict[str, int]),
+        ("bytes_written", int),
+    ],
+)
 
 
 def load_manifest() -> dict:
@@ -53,9 +99,9 @@ def ensure_safe_relative_path(rel_path: Path) -> None:
         raise SystemExit("Refusing to overwrite protected path: {}".format(rel_path))
 
 
-def make_archive_dir(checkpoint: str) -> Path:
+def make_archive_dir(checkpoint: str, root: Path) -> Path:
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    base = ARCHIVE_ROOT / "{}_{}".format(timestamp, checkpoint)
+    base = root / ARCHIVE_DIR / "{}_{}".format(timestamp, checkpoint)
     archive_dir = base
     suffix = 1
     while archive_dir.exists():
@@ -65,47 +111,367 @@ def make_archive_dir(checkpoint: str) -> Path:
     return archive_dir
 
 
-def apply_checkpoint(checkpoint: str, dry_run: bool = False) -> Optional[Path]:
+def store_blob(path: Path, digest: str, root: Path) -> Path:
+    # Content-addressed archive: each distinct content is stored once, named
+    # by its sha256. The replaced file is moved in rather than copied, since
+    # the workspace copy is about to be overwritten anyway.
+    blob = root / ARCHIVE_DIR / "blobs" / digest[:2] / digest
+    if blob.exists():
+        path.unlink()
+        return blob
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(str(path), str(blob))
+    except OSError:
+        shutil.copy2(str(path), str(blob))
+        path.unlink()
+    # Blobs are shared by hardlinks, so editing one would alter every archive.
+    os.chmod(str(blob), stat.S_IMODE(blob.stat().st_mode) & ~0o222)
+    return blob
+
+
+def reflink(source: Path, target: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if target.exists():
+            target.unlink()
+        return False
+    shutil.copystat(str(source), str(target))
+    return True
+
+
+def link_or_copy(source: Path, target: Path) -> str:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(str(source), str(target))
+        return "hardlink"
+    except OSError:
+        pass
+    if reflink(source, target):
+        return "reflink"
+    shutil.copy2(str(source), str(target))
+    return "copy"
+
+
+def load_assets(checkpoint: str) -> List[Asset]:
+    # Assets are read once, so applying to many workspaces reads each
+    # checkpoint file a single time.
     source_root = CHECKPOINT_ROOT / checkpoint
-    files = checkpoint_files(checkpoint)
-    rel_paths = [path.relative_to(source_root) for path in files]
-    for rel_path in rel_paths:
+    assets = []  # type: List[Asset]
+    for src_path in checkpoint_files(checkpoint):
+        rel_path = src_path.relative_to(source_root)
         ensure_safe_relative_path(rel_path)
+        data = src_path.read_bytes()
+        assets.append((src_path, rel_path, data, hashlib.sha256(data).hexdigest()))
+    return assets
+
+
+def write_file(asset: Asset, target: Path) -> None:
+    # Write beside the target and rename over it, so an interrupted apply
+    # never leaves a half-written file.
+    src_path, _, data, _ = asset
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(".{}.checkpoint-tmp".format(target.name))
+    tmp_path.write_bytes(data)
+    shutil.copystat(str(src_path), str(tmp_path))
+    os.replace(str(tmp_path), str(target))
+
+
+def plan_checkpoint(
+    assets: List[Asset], root: Path, cache: "StatCache"
+) -> List[str]:
+    changes = []  # type: List[str]
+    for _, rel_path, data, digest in assets:
+        if not (root / rel_path).exists():
+            changes.append("new")
+        elif cache.digest(rel_path.as_posix(), {len(data)}) == digest:
+            changes.append("unchanged")
+        else:
+            changes.append("changed")
+    return changes
+
+
+def apply_to_root(
+    checkpoint: str, assets: List[Asset], root: Path, dry_run: bool = False
+) -> ApplyResult:
+    cache = StatCache(root)
+    changes = plan_checkpoint(assets, root, cache)
+    updates = [
+        asset for asset, change in zip(assets, changes) if change != "unchanged"
+    ]
+    if dry_run:
+        # A dry run leaves the workspace untouched, stat cache included.
+        return ApplyResult(root, changes, None, {}, 0)
+    if not updates:
+        cache.save()
+        return ApplyResult(root, changes, None, {}, 0)
+
+    archive_dir = make_archive_dir(checkpoint, root)
+    missing = []  # type: List[str]
+    links = {}  # type: Dict[str, int]
+    written = 0
+
+    for asset in updates:
+        _, rel_path, data, _ = asset
+        target = root / rel_path
+        if not target.exists():
+            missing.append(rel_path.as_posix())
+        else:
+            digest = cache.digest(rel_path.as_posix(), {target.stat().st_size})
+            blob = store_blob(target, digest or file_sha256(target), root)
+            method = link_or_copy(blob, archive_dir / rel_path)
+            links[method] = links.get(method, 0) + 1
+        write_file(asset, target)
+        written += len(data)
+    cache.save()
+
+    if missing:
+        (archive_dir / "_missing_before_checkpoint.txt").write_text(
+            "\n".join(missing) + "\n", encoding="utf-8"
+        )
+    return ApplyResult(root, changes, archive_dir, links, written)
+
+
+def format_links(links: Dict[str, int]) -> str:
+    return ", ".join(
+        "{} {}".format(count, method) for method, count in sorted(links.items())
+    )
+
+
+def apply_checkpoint(checkpoint: str, dry_run: bool = False) -> Optional[Path]:
+    assets = load_assets(checkpoint)
+    result = apply_to_root(checkpoint, assets, REPO_ROOT, dry_run=dry_run)
 
     print("Checkpoint: {}".format(checkpoint))
     print("Files to replace:")
-    for rel_path in rel_paths:
-        target = REPO_ROOT / rel_path
-        marker = "exists" if target.exists() else "new"
-        print("  {} ({})".format(rel_path.as_posix(), marker))
+    for (_, rel_path, _, _), change in zip(assets, result.changes):
+        print("  {} ({})".format(rel_path.as_posix(), change))
 
     if dry_run:
         print("Dry run only; no files changed.")
         return None
+    if result.archive_dir is None:
+        print("Workspace already matches checkpoint {}.".format(checkpoint))
+        return None
 
-    archive_dir = make_archive_dir(checkpoint)
-    missing = []  # type: List[str]
+    n_written = len(assets) - result.changes.count("unchanged")
+    print(
+        "Applied checkpoint {}: {} file(s) written ({} bytes), {} unchanged.".format(
+            checkpoint, n_written, result.bytes_written, len(assets) - n_written
+        )
+    )
+    if result.links:
+        print(
+            "Archived replaced files in: {} ({})".format(
+                result.archive_dir, format_links(result.links)
+            )
+        )
+    else:
+        print("Archived list of new files in: {}".format(result.archive_dir))
+    return result.archive_dir
+
+
+def read_roots_file(path: Path) -> List[Path]:
+    roots = []  # type: List[Path]
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        root = Path(line).expanduser().resolve()
+        if not root.is_dir():
+            raise SystemExit("Workspace root not found: {}".format(root))
+        roots.append(root)
+    if not roots:
+        raise SystemExit("No workspace roots listed in {}".format(path))
+    if len(set(roots)) != len(roots):
+        raise SystemExit("Workspace roots listed more than once in {}".format(path))
+    return roots
+
+
+def apply_to_roots(
+    checkpoint: str, roots: List[Path], jobs: int, dry_run: bool = False
+) -> int:
+    # Workspaces on a shared filesystem are bound by I/O latency rather than
+    # CPU, so threads overlap the round trips of many workspaces at once.
+    assets = load_assets(checkpoint)
+    print(
+        "Checkpoint: {} ({} files) -> {} workspaces, {} jobs".format(
+            checkpoint, len(assets), len(roots), jobs
+        )
+    )
+    start = time.perf_counter()
+    failures = 0
+    files_written = 0
+    bytes_written = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(apply_to_root, checkpoint, assets, root, dry_run): root
+            for root in roots
+        }
+        for future in concurrent.futures.as_completed(futures):
+            root = futures[future]
+            try:
+                result = future.result()
+            except OSError as exc:
+                failures += 1
+                print("  {}: FAILED: {}".format(root, exc))
+                continue
+            counts = {change: result.changes.count(change) for change in CHANGES}
+            summary = ", ".join(
+                "{} {}".format(counts[change], change) for change in CHANGES
+            )
+            if result.links:
+                summary += "; archived {}".format(format_links(result.links))
+            print("  {}: {}".format(root, summary))
+            files_written += counts["new"] + counts["changed"]
+            bytes_written += result.bytes_written
+
+    elapsed = time.perf_counter() - start
+    if dry_run:
+        print("Dry run only; no files changed.")
+        return 1 if failures else 0
+    print(
+        "Total: {} files, {:.2f} MB written to {} workspaces in {:.2f} s "
+        "({:.2f} MB/s, {:.1f} files/s).".format(
+            files_written,
+            bytes_written / 1e6,
+            len(roots) - failures,
+            elapsed,
+            bytes_written / 1e6 / elapsed,
+            files_written / elapsed,
+        )
+    )
+    if failures:
+        print("{} workspace(s) failed.".format(failures))
+        return 1
+    return 0
 
-    for src_path, rel_path in zip(files, rel_paths):
-        target = REPO_ROOT / rel_path
-        archive_target = archive_dir / rel_path
-        if target.exists():
-            archive_target.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(str(target), str(archive_target))
-        else:
-            missing.append(rel_path.as_posix())
 
-        target.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(str(src_path), str(target))
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    if missing:
-        (archive_dir / "_missing_before_checkpoint.txt").write_text(
-            "\n".join(missing) + "\n", encoding="utf-8"
+
+def hash_checkpoint(checkpoint: str) -> Dict[str, Tuple[int, str]]:
+    source_root = CHECKPOINT_ROOT / checkpoint
+    return {
+        path.relative_to(source_root).as_posix(): (
+            path.stat().st_size,
+            file_sha256(path),
         )
+        for path in checkpoint_files(checkpoint)
+    }
 
-    print("Applied checkpoint {}.".format(checkpoint))
-    print("Archived replaced files in: {}".format(archive_dir))
-    return archive_dir
+
+def write_index(manifest: dict) -> None:
+    checkpoints = {}
+    for checkpoint in manifest["checkpoints"]:
+        checkpoints[checkpoint] = {
+            rel_path: {"size": size, "sha256": digest}
+            for rel_path, (size, digest) in hash_checkpoint(checkpoint).items()
+        }
+    record = {"format": INDEX_FORMAT, "checkpoints": checkpoints}
+    INDEX_PATH.write_text(json.dumps(record, indent=2) + "\n", encoding="utf-8")
+    print("Wrote checkpoint index: {}".format(INDEX_PATH))
+
+
+def load_index(manifest: dict) -> Tuple[Index, List[str]]:
+    # Asset digests come from a stat cache next to the checkpoints, so an
+    # asset is hashed again whenever its size or mtime changes, including a
+    # same-size edit. Checkpoints whose digests differ from the committed
+    # index are returned as stale, with the digests of the files on disk.
+    try:
+        record = json.loads(INDEX_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        record = {}
+    if record.get("format") != INDEX_FORMAT:
+        record = {}
+    indexed = record.get("checkpoints", {})
+
+    cache = StatCache(CHECKPOINT_ROOT)
+    index = {}  # type: Index
+    stale = []  # type: List[str]
+    for checkpoint in manifest["checkpoints"]:
+        source_root = CHECKPOINT_ROOT / checkpoint
+        files = {}  # type: Dict[str, Tuple[int, str]]
+        for path in checkpoint_files(checkpoint):
+            rel_path = path.relative_to(source_root).as_posix()
+            size = path.stat().st_size
+            digest = cache.digest("{}/{}".format(checkpoint, rel_path), {size})
+            files[rel_path] = (size, digest or file_sha256(path))
+        entries = indexed.get(checkpoint, {})
+        if files != {
+            rel_path: (entry["size"], entry["sha256"])
+            for rel_path, entry in entries.items()
+        }:
+            stale.append(checkpoint)
+        index[checkpoint] = files
+    cache.save()
+    return index, stale
+
+
+class StatCache:
+    """sha256 digests of workspace files, reused while size and mtime match."""
+
+    # Entries map a relative path to [size, mtime_ns, sha256].
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.path = root / STAT_CACHE_NAME
+        self.entries = {}  # type: Dict[str, List]
+        self.dirty = False
+        try:
+            record = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if record.get("format") == STAT_CACHE_FORMAT:
+            self.entries = record.get("files", {})
+
+    def digest(self, rel_path: str, sizes: Set[int]) -> Optional[str]:
+        # None means the file cannot match: it is missing or its size is not
+        # one any checkpoint ships, so it is never hashed.
+        path = self.root / rel_path
+        try:
+            info = path.stat()
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode) or info.st_size not in sizes:
+            return None
+        key = [info.st_size, info.st_mtime_ns]
+        entry = self.entries.get(rel_path)
+        if entry is not None and entry[:2] == key:
+            return entry[2]
+
+        digest = file_sha256(path)
+        if time.time() - info.st_mtime > RACY_SECONDS:
+            self.entries[rel_path] = key + [digest]
+            self.dirty = True
+        elif self.entries.pop(rel_path, None) is not None:
+            self.dirty = True
+        return digest
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        record = {"format": STAT_CACHE_FORMAT, "files": self.entries}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            tmp_path.write_text(json.dumps(record), encoding="utf-8")
+            os.replace(str(tmp_path), str(self.path))
+        except OSError:
+            # A read-only workspace still gets an answer, just not a faster
+            # one next time.
+            return
+        self.dirty = False
 
 
 def list_checkpoints(manifest: dict) -> None:
@@ -114,17 +480,34 @@ def list_checkpoints(manifest: dict) -> None:
 
 
 def status(manifest: dict) -> None:
-    matches = []  # type: List[str]
-    for checkpoint in manifest["checkpoints"]:
-        source_root = CHECKPOINT_ROOT / checkpoint
-        files = checkpoint_files(checkpoint)
+    index, stale = load_index(manifest)
+    if stale:
+        print(
+            "Checkpoint index is missing or stale for {}; "
+            "run `checkpoint.py index` to refresh it.".format(", ".join(stale))
+        )
+
+    # One pass over the workspace: each path any checkpoint ships is stat'ed
+    # once and hashed only if its size could match and the cache is stale.
+    sizes = {}  # type: Dict[str, Set[int]]
+    for entries in index.values():
+        for rel_path, (size, _) in entries.items():
+            sizes.setdefault(rel_path, set()).add(size)
+    cache = StatCache(REPO_ROOT)
+    workspace = {
+        rel_path: cache.digest(rel_path, rel_sizes)
+        for rel_path, rel_sizes in sorted(sizes.items())
+    }
+    cache.save()
+
+    matches = [
+        checkpoint
+        for checkpoint, entries in index.items()
         if all(
-            (REPO_ROOT / path.relative_to(source_root)).is_file()
-            and (REPO_ROOT / path.relative_to(source_root)).read_bytes()
-            == path.read_bytes()
-            for path in files
-        ):
-            matches.append(checkpoint)
+            workspace[rel_path] == digest
+            for rel_path, (_, digest) in entries.items()
+        )
+    ]
 
     if matches:
         print("Current files match checkpoint asset contents for:")
@@ -142,11 +525,31 @@ def main() -> int:
 
     subparsers.add_parser("list", help="List available checkpoints.")
     subparsers.add_parser("status", help="Check which checkpoint files match.")
+    index_parser = subparsers.add_parser(
+        "index", help="Rebuild the sha256 index of checkpoint assets."
+    )
+    index_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 if the index is stale instead of rewriting it.",
+    )
 
     apply_parser = subparsers.add_parser(
         "apply", help="Apply a checkpoint after archiving replaced files."
     )
     apply_parser.add_argument("checkpoint", help="Checkpoint name or alias.")
+    apply_parser.add_argument(
+        "--roots-file",
+        type=Path,
+        help="Apply to every workspace root listed in this file (one per line) "
+        "instead of this repo.",
+    )
+    apply_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=8,
+        help="Workspaces written in parallel with --roots-file (default: 8).",
+    )
     apply_parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -166,8 +569,31 @@ def main() -> int:
     if args.command == "status":
         status(manifest)
         return 0
+    if args.command == "index":
+        if args.check:
+            index, stale = load_index(manifest)
+            stale = [
+                checkpoint
+                for checkpoint in index
+                if checkpoint in stale
+                or index[checkpoint] != hash_checkpoint(checkpoint)
+            ]
+            if stale:
+                print("Stale index entries: {}".format(", ".join(stale)))
+                return 1
+            print("Checkpoint index is up to date.")
+            return 0
+        write_index(manifest)
+        return 0
     if args.command == "apply":
         checkpoint = normalize_name(args.checkpoint, manifest)
+        if args.roots_file is not None:
+            if args.jobs <= 0:
+                parser.error("--jobs must be a positive integer")
+            roots = read_roots_file(args.roots_file)
+            return apply_to_roots(
+                checkpoint, roots, min(args.jobs, len(roots)), dry_run=args.dry_run
+            )
         apply_checkpoint(checkpoint, dry_run=args.dry_run)
         return 0
 
@@ -1,16 +1,273 @@
 from datasets import load_dataset
-from torch.utils.data import DataLoader, default_collate
+from torch.utils.data import DataLoader, Dataset, IterableDataset, default_collate
+from torch.utils.data import get_worker_info
 from transformers import AutoTokenizer
 
+import bisect
+import copy
+import fcntl
+import json
 import os
+import random
+import shutil
+from itertools import chain, islice
+
+import numpy as np
+import torch
+
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+# bump this when the layout of the token cache files changes
+TOKEN_CACHE_VERSION = 1
+
+
+class TokenCache(Dataset):
+    def __init__(self, directory: str, split: str):
+        """
+        Token ids of one split, read from the flat files written by `PubMedDataset`.
+        Document `ix` is `tokens[offsets[ix]:offsets[ix + 1]]`. The token file is
+        memory-mapped, so only the pages a batch touches are ever read from disk.
+
+        Args:
+        - directory (str): the token cache directory for one tokenizer and truncation length
+        - split (str): "train" or "test"
+        """
+        self.tokens_path = os.path.join(directory, f"{split}.tokens.npy")
+        self.offsets_path = os.path.join(directory, f"{split}.offsets.npy")
+        self.offsets = np.load(self.offsets_path)
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        # opened lazily so DataLoader workers each map the file themselves
+        # instead of receiving a pickled copy of it
+        if self._tokens is None:
+            self._tokens = np.load(self.tokens_path, mmap_mode="r")
+        return self._tokens
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tokens"] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, ix):
+        return self.tokens[self.offsets[ix] : self.offsets[ix + 1]]
+
+
+class PackedTokenCache(TokenCache):
+    def __init__(self, directory: str, split: str, block_size: int):
+        """
+        The token stream of a `TokenCache` cut into dense blocks of `block_size` tokens.
+        Documents run on from one block into the next, separated by the tokenizer's
+        special tokens ([SEP] [CLS] for BERT-style tokenizers), so every position is a real
+        token. Only the final block can be shorter than `block_size`. The cache should be
+        built without truncation, so long documents are split at block boundaries instead
+        of losing their tails.
+
+        Args:
+        - directory (str): the untruncated token cache directory for one tokenizer
+        - split (str): "train" or "test"
+        - block_size (int): tokens per packed sequence
+        """
+        super().__init__(directory, split)
+        self.block_size = block_size
+
+    def __len__(self):
+        return -(-int(self.offsets[-1]) // self.block_size)
+
+    def __getitem__(self, ix):
+        return self.tokens[ix * self.block_size : (ix + 1) * self.block_size]
+
+
+def _available_cpus():
+    # cpus this process may run on (respects taskset/Slurm affinity), not all cpus on the node
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def _distributed_rank():
+    # (rank, world size) of this process under DDP or torchrun, (0, 1) otherwise
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return int(os.environ.get("RANK", 0)), int(os.environ.get("WORLD_SIZE", 1))
+
+
+def _shuffled(items, buffer_size, rng):
+    # approximate shuffle holding at most `buffer_size` items in memory
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        ix = rng.randrange(buffer_size)
+        yield buffer[ix]
+        buffer[ix] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class StreamingText(IterableDataset):
+    def __init__(
+        self,
+        path: str,
+        shuffle: bool = False,
+        shuffle_buffer: int = 10_000,
+        seed: int = 0,
+        counts_dir: str = None,
+    ):
+        """
+        Lines of a text file, read lazily and split between DDP ranks and DataLoader workers.
+        The file is cut into one contiguous byte range per (rank, worker) shard and each
+        shard yields the lines that start in its range, so every line is seen exactly once
+        per epoch and memory stays constant whatever the corpus size. With `shuffle`, lines
+        pass through a shuffle buffer of `shuffle_buffer` lines seeded by (seed, epoch, shard).
+
+        Shards hold about the same number of bytes, not lines. Under DDP, a rank that ran out
+        of batches first would leave the others waiting in their last all-reduce, so with more
+        than one rank every shard stops after as many lines as the shortest shard holds (the
+        few lines past that are skipped for the epoch). Counting the lines takes one read of
+        the file, done by rank 0 alone and broadcast to the others; with `counts_dir` the
+        count is stored there, keyed by file size and mtime, so later runs start at once.
+
+        `set_epoch` is seen by DataLoader workers when they start, so it does not reach
+        `persistent_workers=True` workers; `PubMedDataset.get_dataloader` rejects shuffling
+        with persistent workers for that reason.
+
+        Args:
+        - path (str): the text file, one document per line
+        - shuffle (bool): shuffle lines within the bounded buffer
+        - shuffle_buffer (int): lines held in memory for shuffling
+        - seed (int): base seed for the shuffle; call `set_epoch` to vary it per epoch
+        - counts_dir (str): optional directory where shard line counts are stored
+        """
+        self.path = path
+        self.counts_dir = counts_dir
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        # a list so that shallow copies (see `PubMedDataset.get_dataloader`) share the epoch
+        self._epoch = [0]
+        self._shard_lengths = {}
+
+    @property
+    def epoch(self):
+        return self._epoch[0]
+
+    def set_epoch(self, epoch):
+        self._epoch[0] = epoch
+
+    def _lines_per_shard(self, num_shards):
+        # the fewest lines any of `num_shards` shards holds, found once per shard count
+        if num_shards not in self._shard_lengths:
+            if torch.distributed.is_available() and torch.distributed.is_initialized():
+                # one rank reads the file; the others wait for its answer
+                count = [None]
+                if torch.distributed.get_rank() == 0:
+                    count[0] = self._load_or_count_lines(num_shards)
+                torch.distributed.broadcast_object_list(count, src=0)
+                self._shard_lengths[num_shards] = count[0]
+            else:
+                self._shard_lengths[num_shards] = self._load_or_count_lines(num_shards)
+        return self._shard_lengths[num_shards]
+
+    def _load_or_count_lines(self, num_shards):
+        if self.counts_dir is None:
+            return min(self._count_shard_lines(num_shards))
+
+        info = os.stat(self.path)
+        key = f"{os.path.abspath(self.path)}:{info.st_size}:{info.st_mtime_ns}:{num_shards}"
+        counts_path = os.path.join(self.counts_dir, "line_counts.json")
+        try:
+            with open(counts_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        if key not in stored:
+            stored[key] = min(self._count_shard_lines(num_shards))
+            os.makedirs(self.counts_dir, exist_ok=True)
+            tmp_path = f"{counts_path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, counts_path)
+        return stored[key]
+
+    def _count_shard_lines(self, num_shards):
+        # the lines `_lines` yields for each shard, in one pass and without decoding: a line
+        # belongs to the shard whose byte range contains its first byte
+        size = os.path.getsize(self.path)
+        starts = [shard * size // num_shards for shard in range(num_shards)]
+        counts = [0] * num_shards
+        position = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.rstrip(b"\r\n"):
+                    counts[bisect.bisect_right(starts, position) - 1] += 1
+                position += len(line)
+        return counts
+
+    def _shard(self):
+        rank, world_size = _distributed_rank()
+        worker = get_worker_info()
+        if worker is None:
+            return rank, world_size
+        return rank * worker.num_workers + worker.id, world_size * worker.num_workers
+
+    def _lines(self, shard, num_shards):
+        size = os.path.getsize(self.path)
+        start, end = shard * size // num_shards, (shard + 1) * size // num_shards
+        with open(self.path, "rb") as f:
+            if start > 0:
+                # skip the line running into our range; it belongs to the previous shard
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line:
+                    yield line
+
+    def __iter__(self):
+        shard, num_shards = self._shard()
+        lines = self._lines(shard, num_shards)
+        if self.shuffle:
+            rng = random.Random(f"{self.seed}-{self.epoch}-{shard}")
+            lines = _shuffled(lines, self.shuffle_buffer, rng)
+        if _distributed_rank()[1] > 1:
+            # cut after shuffling so the skipped lines change from epoch to epoch
+            lines = islice(lines, self._lines_per_shard(num_shards))
+        for line in lines:
+            yield {"text": line}
+
+
+def padding_fraction(lengths, batch_size):
+    """
+    Fraction of positions that are padding when sequences with the given `lengths` are
+    batched in order and each batch is padded to its longest sequence.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.arange(0, len(lengths), batch_size)
+    longest = np.maximum.reduceat(lengths, starts)
+    counts = np.diff(np.append(starts, len(lengths)))
+    return 1 - lengths.sum() / (longest * counts).sum()
+
+
 class PubMedDataset:
     def __init__(
         self,
         root: str,
         max_tokens: int = 512,
         tokenizer_model: str = "dmis-lab/biobert-base-cased-v1.2",
+        cache_dir: str = None,
+        num_proc: int = None,
+        packed: bool = False,
+        streaming: bool = False,
+        shuffle_buffer: int = 10_000,
     ):
         """
         Create a pytorch dataset suitable for LLM training. This class uses the huggingface dataset
@@ -18,28 +275,127 @@ class PubMedDataset:
         pytorch code. Batches will be truncated to `max_tokens` or to the size of the shortest
         document in the batch.
 
+        With `cache_dir`, the abstracts are tokenized once (in parallel with `datasets.map`) and
+        the token ids are stored in flat memory-mapped files under `cache_dir`, keyed by tokenizer
+        and `max_tokens`. Later runs reuse the cache, and dataloaders only slice and pad, so
+        tokenization is no longer repeated for every batch of every epoch.
+
+        With `packed=True` (which needs `cache_dir`), documents are concatenated and cut into
+        dense blocks of `max_tokens` tokens instead of being padded one per row, so the model
+        spends no compute on padding. The packed cache is tokenized without truncation (and
+        keyed separately), so long abstracts continue into the next block rather than losing
+        their tails. Use `padding_report` to compare the two layouts.
+
+        With `streaming=True`, nothing is loaded up front: dataloaders read the text files
+        lazily, sharded across DDP ranks and DataLoader workers, and `shuffle=True` shuffles
+        within a buffer of `shuffle_buffer` lines. Training starts right away and memory does
+        not grow with the corpus. Under DDP, the first run reads each file once to equalize
+        the ranks' batch counts (see `StreamingText`); pass `cache_dir` to store those counts
+        so later runs skip that read.
+
         Args:
         - root (str): the file path to a directory containing pubmed train.txt and test.txt files
         - max_tokens (int): the maximum number of tokens allowed in a sequence.
-        - tokenizer_model (str): the model 
+        - tokenizer_model (str): the model
+        - cache_dir (str): optional directory for the pre-tokenized token cache (streaming:
+          for the shard line counts)
+        - num_proc (int): processes used to build the token cache (default: the cpus this
+          process may run on)
+        - packed (bool): serve dense packed blocks instead of one padded document per row
+        - streaming (bool): read the text files lazily instead of loading them up front
+        - shuffle_buffer (int): lines held in memory to shuffle a streaming dataloader
         """
+        if packed and streaming:
+            raise ValueError("packed=True reads the token cache; it cannot use streaming=True")
+        if packed and cache_dir is None:
+            raise ValueError("packed=True needs a cache_dir for the pre-tokenized token stream")
 
         self.root = root
         self.max_tokens = max_tokens
+        # packed blocks split long documents themselves, so their cache keeps every token
+        self.truncate_to = None if packed else max_tokens
+        self.packed = packed
+        self.streaming = streaming
         self.train_test_files = {"train": root + "train.txt", "test": root + "test.txt"}
-        self.dataset = load_dataset("text", data_files=self.train_test_files)
 
         self.tokenizer_model = tokenizer_model
         self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_model)
 
+        if streaming:
+            self.cache_path = None
+            self.dataset = {
+                split: StreamingText(path, shuffle_buffer=shuffle_buffer, counts_dir=cache_dir)
+                for split, path in self.train_test_files.items()
+            }
+            self._collate_fn = self._custom_collate
+        elif cache_dir is None:
+            self.cache_path = None
+            self.dataset = load_dataset("text", data_files=self.train_test_files)
+            self._collate_fn = self._custom_collate
+        else:
+            self.cache_path = self._token_cache_path(cache_dir)
+            if not self._token_cache_is_valid():
+                self._build_token_cache_once(num_proc or _available_cpus())
+            if packed:
+                self.dataset = {
+                    split: PackedTokenCache(self.cache_path, split, max_tokens)
+                    for split in self.train_test_files
+                }
+            else:
+                self.dataset = {
+                    split: TokenCache(self.cache_path, split)
+                    for split in self.train_test_files
+                }
+            self._collate_fn = self._pad_collate
+
     def get_dataloader(self, split, **dataloader_kwargs):
         """
         Return a pytorch dataloader for the specified `split`. Accepts any arguments
         accepted by DataLoader except for `collate_fn`.
+
+        For a streaming dataset, call `set_epoch` on `self.dataset[split]` (or on the loader's
+        `dataset`, which shares it) before each epoch to reshuffle.
         """
-        return DataLoader(
-            self.dataset[split], collate_fn=self._custom_collate, **dataloader_kwargs
+        dataset = self.dataset[split]
+        if self.streaming:
+            # DataLoader rejects `shuffle` for iterable datasets; the stream shuffles itself
+            dataset = copy.copy(dataset)
+            dataset.shuffle = dataloader_kwargs.pop("shuffle", False)
+            if dataset.shuffle and dataloader_kwargs.get("persistent_workers"):
+                raise ValueError(
+                    "persistent_workers=True would never see set_epoch; the streaming "
+                    "shuffle needs workers that restart every epoch"
+                )
+            world_size = _distributed_rank()[1]
+            if world_size > 1:
+                # count shard lengths here, once; workers get a pickled copy every epoch
+                num_workers = dataloader_kwargs.get("num_workers", 0)
+                dataset._lines_per_shard(world_size * max(num_workers, 1))
+        return DataLoader(dataset, collate_fn=self._collate_fn, **dataloader_kwargs)
+
+    def padding_report(self, split, batch_size):
+        """
+        Print and return the fraction of batch positions that are padding for `split`,
+        one padded document per row versus packed blocks, with batches taken in order.
+        The saving in forward/backward compute is roughly proportional to the difference.
+        """
+        if self.cache_path is None:
+            raise ValueError("padding_report needs the token cache; pass cache_dir")
+
+        doc_lengths = np.diff(self.dataset[split].offsets)
+        full_blocks, last_block = divmod(int(doc_lengths.sum()), self.max_tokens)
+        block_lengths = [self.max_tokens] * full_blocks + ([last_block] if last_block else [])
+
+        report = {
+            # unpacked rows are truncated to max_tokens; the packed cache keeps every token
+            "unpacked": padding_fraction(np.minimum(doc_lengths, self.max_tokens), batch_size),
+            "packed": padding_fraction(block_lengths, batch_size),
+        }
+        print(
+            f"{split} padding fraction at batch_size={batch_size}: "
+            f"{report['unpacked']:.1%} unpacked, {report['packed']:.1%} packed"
         )
+        return report
 
     def decode_batch(self, batch_input_ids):
         """
@@ -67,3 +423,111 @@ class PubMedDataset:
         batch["text"] = self._clean_and_tokenize(batch["text"])
 
         return batch["text"]
+
+    def _pad_collate(self, batch_list):
+        # the documents are already tokenized; pad them to the longest in the batch
+        lengths = torch.tensor([len(ids) for ids in batch_list])
+        input_ids = torch.full(
+            (len(batch_list), int(lengths.max())), self.tokenizer.pad_token_id
+        )
+        for row, ids in enumerate(batch_list):
+            input_ids[row, : len(ids)] = torch.from_numpy(ids.astype(np.int64))
+        attention_mask = (torch.arange(input_ids.shape[1]) < lengths[:, None]).long()
+
+        return {
+            "input_ids": input_ids,
+            "token_type_ids": torch.zeros_like(input_ids),
+            "attention_mask": attention_mask,
+        }
+
+    def _token_cache_path(self, cache_dir):
+        tokenizer_key = self.tokenizer_model.replace("/", "--")
+        if self.truncate_to is None:
+            return os.path.join(cache_dir, f"{tokenizer_key}_full")
+        return os.path.join(cache_dir, f"{tokenizer_key}_max{self.truncate_to}")
+
+    def _token_cache_meta(self):
+        # a cache is only reused for the same tokenizer, truncation and source files
+        return {
+            "version": TOKEN_CACHE_VERSION,
+            "tokenizer_model": self.tokenizer_model,
+            "vocab_size": len(self.tokenizer),
+            "max_tokens": self.truncate_to,
+            "files": {
+                split: [os.path.getsize(path), os.path.getmtime(path)]
+                for split, path in self.train_test_files.items()
+            },
+        }
+
+    def _token_cache_is_valid(self):
+        try:
+            with open(os.path.join(self.cache_path, "meta.json")) as f:
+                return json.load(f) == self._token_cache_meta()
+        except (OSError, ValueError):
+            return False
+
+    def _build_token_cache_once(self, num_proc):
+        # DDP ranks (and any other jobs sharing cache_dir) start at the same time; the first
+        # to take the lock builds the cache and the others wait, then find it valid. Without
+        # the lock every rank would tokenize the corpus and replace a cache that another rank
+        # may already be reading.
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(f"{self.cache_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not self._token_cache_is_valid():
+                    self._build_token_cache(num_proc)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _build_token_cache(self, num_proc):
+        def tokenize(batch):
+            # same cleaning and truncation as `_clean_and_tokenize` (none for packing),
+            # but no padding
+            input_ids = self.tokenizer(
+                [t[1:-1] for t in batch["text"]],
+                truncation=self.truncate_to is not None,
+                max_length=self.truncate_to,
+                return_token_type_ids=False,
+                return_attention_mask=False,
+            )["input_ids"]
+            return {"input_ids": input_ids, "length": [len(ids) for ids in input_ids]}
+
+        dataset = load_dataset("text", data_files=self.train_test_files)
+        tokenized = dataset.map(
+            tokenize, batched=True, num_proc=num_proc, remove_columns=["text"]
+        )
+
+        # 2 bytes per token whenever the vocabulary fits
+        dtype = np.uint16 if len(self.tokenizer) <= 2**16 else np.uint32
+
+        # write into a temporary directory and rename it into place, so an
+        # interrupted build never leaves a cache that looks complete
+        tmp_path = f"{self.cache_path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for split, data in tokenized.items():
+            offsets = np.zeros(len(data) + 1, dtype=np.int64)
+            np.cumsum(np.asarray(data["length"], dtype=np.int64), out=offsets[1:])
+            np.save(os.path.join(tmp_path, f"{split}.offsets.npy"), offsets)
+
+            tokens = np.lib.format.open_memmap(
+                os.path.join(tmp_path, f"{split}.tokens.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(int(offsets[-1]),),
+            )
+            position = 0
+            for batch in data.iter(batch_size=1000):
+                count = sum(batch["length"])
+                tokens[position : position + count] = np.fromiter(
+                    chain.from_iterable(batch["input_ids"]), dtype=dtype, count=count
+                )
+                position += count
+            tokens.flush()
+            del tokens
+
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(self._token_cache_meta(), f)
+        shutil.rmtree(self.cache_path, ignore_errors=True)
+        os.replace(tmp_path, self.cache_path)
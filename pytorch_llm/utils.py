@@ -1,3 +1,5 @@
+import time
+
 import torch
 import torch.nn.functional as F
 
@@ -21,6 +23,66 @@ def masked_cross_entropy(logits, targets, mask):
     return mean_loss
 
 
+class _ChunkedCrossEntropy(torch.autograd.Function):
+    # Summed, mask-weighted cross entropy over (N, L, V) logits, computed one slice of the
+    # sequence axis at a time. When a gradient is needed, each slice's gradient
+    # (softmax - one_hot) * mask is written into one preallocated buffer during forward,
+    # so backward only rescales that buffer and nothing is recomputed.
+
+    @staticmethod
+    def forward(ctx, logits, targets, mask, chunk_size, needs_grad):
+        weights = mask.float()
+        grad = torch.empty_like(logits) if needs_grad else None
+        total_loss = logits.new_zeros((), dtype=torch.float32)
+        step = max(1, chunk_size // logits.shape[0])  # sequence positions per slice
+        for start in range(0, logits.shape[1], step):
+            end = start + step
+            # (N, step, V); always a copy, even of float32 logits, as it is updated in place
+            rows = logits[:, start:end].to(torch.float32, copy=True)
+            target_ix = targets[:, start:end, None]
+            w = weights[:, start:end]
+            lse = torch.logsumexp(rows, dim=-1)
+            token_loss = lse - rows.gather(-1, target_ix).squeeze(-1)
+            total_loss += (token_loss * w).sum()
+            if grad is not None:
+                probs = rows.sub_(lse[..., None]).exp_()  # softmax, in place
+                probs.scatter_add_(-1, target_ix, probs.new_full(target_ix.shape, -1.0))
+                grad[:, start:end] = probs.mul_(w[..., None])
+
+        num_real = weights.sum().clamp(min=1)
+        if grad is not None:
+            ctx.save_for_backward(grad, num_real)
+        return total_loss / num_real
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad, num_real = ctx.saved_tensors
+        # scaled in place: the buffer is only ever handed out once
+        return grad.mul_(grad_output / num_real), None, None, None, None
+
+
+def chunked_masked_cross_entropy(logits, targets, mask, chunk_size=512):
+    """
+    Same mean loss as `masked_cross_entropy`, at a fraction of the activation memory.
+
+    Takes the logits exactly as the model returns them, so no permuted copy is made. The
+    loss is computed over slices of about `chunk_size` positions along the sequence axis,
+    with padding zeroed by the mask, so the extra float32 memory is about `chunk_size x V`
+    floats rather than several `N x L x V` tensors. When gradients are tracked, the
+    gradient of the logits is written slice by slice into a single buffer during the
+    forward pass, and backward just rescales it; the loss can only be backpropagated once.
+    The number of real tokens stays on the device, so there is no host sync.
+
+    Args:
+    - logits: The next token prediction logits. Last element removed. Shape (N, L-1, V)
+    - targets: Ids of the correct next tokens. First element removed (N, L-1)
+    - mask: the attention mask tensor. First element removed (N, L-1)
+    - chunk_size: positions whose softmax is computed at once
+    """
+    needs_grad = logits.requires_grad and torch.is_grad_enabled()
+    return _ChunkedCrossEntropy.apply(logits, targets, mask, chunk_size, needs_grad)
+
+
 def test(model, dataloader, reporting_interval=5):
     model.eval()
     for ix, batch in enumerate(dataloader):
@@ -29,8 +91,8 @@ def test(model, dataloader, reporting_interval=5):
         mask = batch["attention_mask"][:, 1:].to("cuda")  # remove first
 
         with torch.no_grad():  # turn off gradient tracking since this is for evaluation
-            logits = model(x).permute(0, 2, 1)
-            loss = masked_cross_entropy(logits, targets, mask)
+            logits = model(x)
+            loss = chunked_masked_cross_entropy(logits, targets, mask)
 
         if ix % reporting_interval == 0:
             print(f"Batch {ix} testing loss: {loss.item()}")
@@ -43,8 +105,8 @@ def train(model, dataloader, optimizer, reporting_interval=20):
         targets = batch["input_ids"][:, 1:].to("cuda")  # remove first
         mask = batch["attention_mask"][:, 1:].to("cuda")  # remove first
 
-        logits = model(x).permute(0, 2, 1)
-        loss = masked_cross_entropy(logits, targets, mask)
+        logits = model(x)
+        loss = chunked_masked_cross_entropy(logits, targets, mask)
 
         # do the gradient optimization stuff
         optimizer.zero_grad()
@@ -55,27 +117,343 @@ def train(model, dataloader, optimizer, reporting_interval=20):
             print(f"Batch {ix} training loss: {loss.item()}")
 
 
-def generate(model, idx, max_new_tokens):
-    model.eval()
+class Trainer:
+    def __init__(
+        self,
+        model,
+        optimizer,
+        device=None,
+        bf16=True,
+        grad_accum_steps=1,
+        compile=False,
+    ):
+        """
+        Device-agnostic training and evaluation loops, for the same code on GPU and CPU-only nodes.
+
+        Batches are copied with `non_blocking=True`, so pass `pin_memory=True` to the
+        DataLoader when training on a GPU. Losses and token counts are summed on the device
+        and only read back when a report is printed and at the end of an epoch, and the loss
+        never reads the mask back either, so there is no host sync per step.
+
+        Args:
+        - model: the language model; moved to `device`
+        - optimizer: the optimizer for the model's parameters
+        - device: e.g. "cuda", "cpu" or "cuda:1" (default: cuda if available, else cpu)
+        - bf16: run the forward pass under bfloat16 autocast (cpu, and cuda where supported)
+        - grad_accum_steps: batches whose gradients are summed before each optimizer step
+        - compile: wrap the model with `torch.compile`
+        """
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.forward = torch.compile(self.model) if compile else self.model
+        self.optimizer = optimizer
+        self.grad_accum_steps = grad_accum_steps
+        self.bf16 = bf16 and (
+            self.device.type == "cpu"
+            or (self.device.type == "cuda" and torch.cuda.is_bf16_supported())
+        )
+
+    def _prepare(self, batch):
+        input_ids = batch["input_ids"].to(self.device, non_blocking=True)
+        attention_mask = batch["attention_mask"].to(self.device, non_blocking=True)
+        x = input_ids[:, :-1]  # remove last
+        targets = input_ids[:, 1:]  # remove first
+        mask = attention_mask[:, 1:]  # remove first
+        return x, targets, mask
+
+    def _loss(self, x, targets, mask):
+        with torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.bf16):
+            logits = self.forward(x)
+        # the loss itself is computed in float32, one chunk at a time
+        return chunked_masked_cross_entropy(logits, targets, mask)
+
+    def _metrics(self, loss_sum, token_sum, start, num_batches):
+        # the only host sync of the epoch
+        loss = (loss_sum / token_sum.clamp(min=1)).item()
+        tokens = int(token_sum.item())
+        seconds = time.perf_counter() - start
+        return {
+            "loss": loss,
+            "batches": num_batches,
+            "tokens": tokens,
+            "seconds": seconds,
+            "tokens_per_second": tokens / seconds,
+        }
+
+    def train_epoch(self, dataloader, reporting_interval=None):
+        """
+        Train for one pass over `dataloader` and return the token-averaged loss, token count,
+        time and throughput. With `reporting_interval`, also print the running loss every
+        that many batches.
+        """
+        self.model.train()
+        loss_sum = torch.zeros((), device=self.device)
+        token_sum = torch.zeros((), device=self.device, dtype=torch.long)
+        num_batches = 0
+        start = time.perf_counter()
+        self.optimizer.zero_grad(set_to_none=True)
+
+        for ix, batch in enumerate(dataloader):
+            x, targets, mask = self._prepare(batch)
+            loss = self._loss(x, targets, mask)
+            (loss / self.grad_accum_steps).backward()
+            if (ix + 1) % self.grad_accum_steps == 0:
+                self.optimizer.step()
+                self.optimizer.zero_grad(set_to_none=True)
+
+            num_tokens = mask.sum()
+            loss_sum += loss.detach() * num_tokens
+            token_sum += num_tokens
+            num_batches += 1
+            if reporting_interval and ix % reporting_interval == 0:
+                print(f"Batch {ix} training loss: {(loss_sum / token_sum).item()}")
+
+        leftover = num_batches % self.grad_accum_steps
+        if leftover:
+            # apply the gradients of a final, incomplete accumulation, rescaled so they
+            # average its `leftover` batches instead of being divided by grad_accum_steps
+            for group in self.optimizer.param_groups:
+                for param in group["params"]:
+                    if param.grad is not None:
+                        param.grad.mul_(self.grad_accum_steps / leftover)
+            self.optimizer.step()
+            self.optimizer.zero_grad(set_to_none=True)
+        return self._metrics(loss_sum, token_sum, start, num_batches)
+
+    def evaluate(self, dataloader, reporting_interval=None):
+        """
+        Compute the token-averaged loss over `dataloader` without tracking gradients.
+        Returns the same metrics as `train_epoch`.
+        """
+        self.model.eval()
+        loss_sum = torch.zeros((), device=self.device)
+        token_sum = torch.zeros((), device=self.device, dtype=torch.long)
+        num_batches = 0
+        start = time.perf_counter()
+
+        with torch.no_grad():
+            for ix, batch in enumerate(dataloader):
+                x, targets, mask = self._prepare(batch)
+                num_tokens = mask.sum()
+                loss_sum += self._loss(x, targets, mask) * num_tokens
+                token_sum += num_tokens
+                num_batches += 1
+                if reporting_interval and ix % reporting_interval == 0:
+                    print(f"Batch {ix} testing loss: {(loss_sum / token_sum).item()}")
+
+        return self._metrics(loss_sum, token_sum, start, num_batches)
+
+
+class KVCache:
+    def __init__(self, num_layers, batch_size, max_tokens, dim, device=None, dtype=None):
+        """
+        Preallocated per-layer key/value buffers for incremental decoding.
+
+        A model supports cached decoding by defining `make_kv_cache(batch_size, max_tokens)`,
+        which returns one of these, and by accepting `model(x, kv_cache=cache)`. In that call
+        `x` holds only the tokens not yet seen, at positions starting from `cache.length`,
+        and each attention layer replaces its own keys/values with
+        `k, v = kv_cache.update(layer_ix, k, v)`, which returns the keys/values of every
+        position so far. No causal mask is needed when `x` is a single token.
+
+        Args:
+        - num_layers: number of attention layers
+        - batch_size: number of sequences decoded together
+        - max_tokens: longest sequence the cache must hold
+        - dim: size of one position's key (and value) vector, e.g. embed_dim
+        """
+        shape = (num_layers, batch_size, max_tokens, dim)
+        self.keys = torch.empty(shape, device=device, dtype=dtype)
+        self.values = torch.empty(shape, device=device, dtype=dtype)
+        self.length = 0  # positions already cached; advanced by `generate`
+
+    def update(self, layer_ix, k, v):
+        # k, v: (N, L_new, dim) for the new positions
+        end = self.length + k.shape[1]
+        self.keys[layer_ix, :, self.length : end] = k
+        self.values[layer_ix, :, self.length : end] = v
+        return self.keys[layer_ix, :, :end], self.values[layer_ix, :, :end]
+
+    def keep_rows(self, keep):
+        # drop finished sequences so later steps only compute the live ones
+        self.keys = self.keys[:, keep]
+        self.values = self.values[:, keep]
+
+
+def sample_next_token(logits, temperature=1.0, top_k=None, top_p=None):
+    """
+    Sample one token id per row from next-token `logits` (N, V).
+
+    Args:
+    - temperature: divides the logits; 0 means greedy (argmax) decoding
+    - top_k: keep only the `top_k` most likely tokens
+    - top_p: keep the smallest set of most likely tokens whose probability reaches `top_p`
+    """
+    if temperature == 0:
+        return logits.argmax(dim=-1)
+    logits = logits / temperature
+
+    if top_k is not None:
+        kth_largest = torch.topk(logits, min(top_k, logits.shape[-1]), dim=-1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth_largest, float("-inf"))
+
+    if top_p is not None:
+        sorted_logits, sorted_ix = torch.sort(logits, dim=-1, descending=True)
+        sorted_probs = F.softmax(sorted_logits, dim=-1)
+        # drop a token once the more likely tokens before it already reach top_p
+        drop = sorted_probs.cumsum(dim=-1) - sorted_probs >= top_p
+        drop = drop.scatter(-1, sorted_ix, drop)
+        logits = logits.masked_fill(drop, float("-inf"))
+
+    probs = F.softmax(logits, dim=-1)  # (N, V)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)  # (N,)
+
+
+def generate(
+    model,
+    idx,
+    max_new_tokens,
+    temperature=1.0,
+    top_k=None,
+    top_p=None,
+    eos_token_id=None,
+    pad_token_id=None,
+):
     """
-    Recursively generate a sequence one token at a time
+    Generate a sequence one token at a time.
+
+    The output (N, L + max_new_tokens) is allocated once. Models that provide a key/value
+    cache (see `KVCache`) only run the newest token through the model at each step;
+    other models are run on the whole sequence so far. With `eos_token_id`, a row stops once
+    it samples that token: later positions are filled with `pad_token_id` (default: the EOS
+    id), and it is dropped from the batch so it no longer costs compute. Generation ends
+    early, returning a shorter output, once every row has stopped.
     """
+    model.eval()
     # idx is (N, L) array of indices in the current context
-    for _ in range(max_new_tokens):
-        # get the predictions
-        with torch.no_grad():
-            logits = model(idx)  # [N, L, V]
+    N, L = idx.shape
+    if pad_token_id is None:
+        pad_token_id = eos_token_id if eos_token_id is not None else 0
+    out = idx.new_full((N, L + max_new_tokens), pad_token_id)
+    out[:, :L] = idx
 
-        # last time step is prediction for next token
-        logits = logits[:, -1]  # becomes (N, V)
+    active = torch.arange(N, device=idx.device)  # rows still generating
+    cache = model.make_kv_cache(N, L + max_new_tokens) if hasattr(model, "make_kv_cache") else None
+    x = idx  # the tokens the cache has not seen yet
 
-        # apply softmax to get probabilities
-        probs = F.softmax(logits, dim=-1)  # (N, V)
+    with torch.no_grad():
+        for pos in range(L, L + max_new_tokens):
+            # get the prediction for the next token
+            if cache is None:
+                # a view while every row is live; gathering the live rows copies the prefix
+                context = out[:, :pos] if len(active) == N else out[active, :pos]
+                logits = model(context)[:, -1]  # (n_active, V)
+            else:
+                logits = model(x, kv_cache=cache)[:, -1]
+                cache.length += x.shape[1]
+            idx_next = sample_next_token(logits, temperature, top_k, top_p)
+            out[active, pos] = idx_next
 
-        # sample from the distribution
-        idx_next = torch.multinomial(probs, num_samples=1)  # (N, 1)
+            if eos_token_id is not None:
+                alive = idx_next != eos_token_id
+                if not alive.all():
+                    active, idx_next = active[alive], idx_next[alive]
+                    if cache is not None:
+                        cache.keep_rows(alive)
+                    if len(active) == 0:
+                        return out[:, : pos + 1]
+            x = idx_next[:, None]
 
-        # append sampled index to the running sequence
-        idx = torch.cat((idx, idx_next), dim=1)  # (N, L+1)
-        
-    return idx
+    return out
+
+
+class KVCacheReferenceModel(torch.nn.Module):
+    def __init__(self, vocab_size, embed_dim, num_blocks, max_tokens):
+        """
+        A minimal single-head transformer that implements the `KVCache` protocol of
+        `generate`. It is a reference for adding cached decoding to your own model, and
+        `check_kv_cache` uses it to show that cached and uncached decoding agree.
+
+        Args:
+        - vocab_size: number of token ids
+        - embed_dim: size of the token and position embeddings
+        - num_blocks: number of attention + feed-forward blocks
+        - max_tokens: longest sequence the position embedding covers
+        """
+        super().__init__()
+        self.embed_dim = embed_dim
+        self.num_blocks = num_blocks
+        self.tok_embed = torch.nn.Embedding(vocab_size, embed_dim)
+        self.pos_embed = torch.nn.Embedding(max_tokens, embed_dim)
+        self.qkv = torch.nn.ModuleList(
+            [torch.nn.Linear(embed_dim, 3 * embed_dim, bias=False) for _ in range(num_blocks)]
+        )
+        self.feed_forward = torch.nn.ModuleList(
+            [
+                torch.nn.Sequential(
+                    torch.nn.Linear(embed_dim, 4 * embed_dim),
+                    torch.nn.GELU(),
+                    torch.nn.Linear(4 * embed_dim, embed_dim),
+                )
+                for _ in range(num_blocks)
+            ]
+        )
+        self.lay_norms = torch.nn.ModuleList(
+            [torch.nn.LayerNorm(embed_dim) for _ in range(2 * num_blocks)]
+        )
+        self.fout = torch.nn.Linear(embed_dim, vocab_size)
+
+    def make_kv_cache(self, batch_size, max_tokens):
+        weight = self.fout.weight
+        return KVCache(
+            self.num_blocks, batch_size, max_tokens, self.embed_dim, weight.device, weight.dtype
+        )
+
+    def forward(self, x, kv_cache=None):
+        # x.shape = (N, L_new); with a cache, x starts at position kv_cache.length
+        start = 0 if kv_cache is None else kv_cache.length
+        pos = torch.arange(start, start + x.shape[1], device=x.device)
+        h = self.tok_embed(x) + self.pos_embed(pos)  # (N, L_new, embed_dim)
+
+        for layer_ix in range(self.num_blocks):
+            q, k, v = self.qkv[layer_ix](h).chunk(3, dim=-1)
+            if kv_cache is not None:
+                k, v = kv_cache.update(layer_ix, k, v)  # (N, start + L_new, embed_dim)
+            alpha = torch.einsum("Nie,Nje->Nij", q, k) * self.embed_dim**-0.5
+            # query i sits at position start + i and may attend to keys up to there
+            causal = torch.arange(k.shape[1], device=x.device) <= pos[:, None]
+            alpha = alpha.masked_fill(~causal, float("-inf"))
+            v_agg = torch.einsum("Nij,Nje->Nie", alpha.softmax(-1), v)
+            h = self.lay_norms[2 * layer_ix](h + v_agg)
+            h = self.lay_norms[2 * layer_ix + 1](h + self.feed_forward[layer_ix](h))
+
+        return self.fout(h)  # (N, L_new, V)
+
+
+class _WithoutKVCache(torch.nn.Module):
+    # hides `make_kv_cache` so `generate` takes its uncached path
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x)
+
+
+def check_kv_cache(model, idx, max_new_tokens, eos_token_id=None):
+    """
+    Return True if greedy `generate` gives the same tokens with `model`'s key/value cache as
+    without it, i.e. whether the model's cached forward pass is consistent with its full one.
+
+    For example, with a randomly initialized reference model:
+
+        model = KVCacheReferenceModel(vocab_size=100, embed_dim=32, num_blocks=2, max_tokens=64)
+        check_kv_cache(model, torch.randint(100, (3, 8)), 40)
+    """
+    cached = generate(model, idx, max_new_tokens, temperature=0, eos_token_id=eos_token_id)
+    uncached = generate(
+        _WithoutKVCache(model), idx, max_new_tokens, temperature=0, eos_token_id=eos_token_id
+    )
+    return torch.equal(cached, uncached)